@@ -0,0 +1,22 @@
+from os import path
+from yurislib import *
+from yurislib import fileformat as ff
+Root = path.dirname(path.dirname(path.abspath(__file__)))
+Samples = path.join(Root, 'example-files')
+SampleKey = {'v255': KEY_200, 'v494': KEY_300}
+SampleOpt = {  # same as example.py
+    'v255': {},
+    'v494': dict(name_size_trans=ff.NLTransV000,
+                 name_byte_trans=ff.NameXorV000,
+                 hash_name_file=ff.V470Hash),
+}
+
+
+def sample_path(name: str, ext: str):
+    return path.join(Samples, f'{name}.{ext}')
+
+
+def sample_ypfs():
+    for name, opt in SampleOpt.items():
+        with open(sample_path(name, 'ypf'), 'rb') as fp:
+            yield name, YPF(fp, **opt)
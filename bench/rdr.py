@@ -0,0 +1,82 @@
+# python -m bench.rdr  (from the repo root)
+from io import BytesIO
+from time import perf_counter
+from yurislib import fileformat as ff
+from bench import sample_ypfs, SampleKey
+NewRdr, NewMRdr = ff.Rdr, ff.MRdr
+
+
+class Count:
+    reads = 0  # buffer objects (bytes or views) handed out by readers
+    bytes = 0  # of which are copies of the data
+
+
+def count(ret: ff.Buf):
+    Count.reads += 1
+    Count.bytes += not isinstance(ret, memoryview)
+    return ret
+
+
+class OldRdr(NewRdr):  # how Rdr decoded every number before: through a sliced copy
+    __slots__ = []
+
+    def __init__(self, data: ff.Buf, enc: str = ff.CP932):
+        super().__init__(bytes(data), enc)
+
+    def read(self, n: int): return count(super().read(n))
+    def bz(self): return count(super().bz())
+    def ui(self, n: int): return int.from_bytes(self.read(n), ff.LE, signed=False)
+    def si(self, n: int): return int.from_bytes(self.read(n), ff.LE, signed=True)
+    def unpack(self, t: ff.St) -> ff.Ints: return t.unpack(self.read(t.size))
+    def f64(self) -> float: return ff.F64.unpack(self.read(8))[0]
+
+
+class CntRdr(NewRdr):
+    __slots__ = []
+    def read(self, n: int): return count(super().read(n))
+    def bz(self): return count(super().bz())
+
+
+class CntMRdr(NewMRdr):
+    __slots__ = []
+    def read(self, n: int): return count(super().read(n))
+    def bz(self): return count(super().bz())
+
+
+def parse_all(files: dict[str, bytes], key: int, rdr: type[ff.Rdr]):
+    ff.YSVR(rdr(files['ysbin\\ysv.ybn']))
+    ff.YSLB(rdr(files['ysbin\\ysl.ybn']))
+    ff.YSTL(rdr(files['ysbin\\yst_list.ybn']))
+    kcc = ff.YSCM(rdr(files['ysbin\\ysc.ybn'])).kcc
+    for name, data in files.items():
+        if name.startswith('ysbin\\yst0'):
+            ff.YSTB(BytesIO(data), kcc, key)
+
+
+def run(files: dict[str, bytes], key: int, old: bool, rounds: int):
+    # YSTB and Ins.parse_buf make their own readers, swap the classes they use
+    ff.Rdr, ff.MRdr = (OldRdr, OldRdr) if old else (CntRdr, CntMRdr)
+    try:
+        Count.reads = Count.bytes = 0
+        parse_all(files, key, ff.MRdr)
+        reads, copies = Count.reads, Count.bytes
+        best = float('inf')
+        for _ in range(rounds):
+            t = perf_counter()
+            parse_all(files, key, ff.MRdr)
+            best = min(best, perf_counter()-t)
+        return reads, copies, best
+    finally:
+        ff.Rdr, ff.MRdr = NewRdr, NewMRdr
+
+
+def main(rounds: int = 5):
+    for name, ypf in sample_ypfs():
+        files = dict(ypf.files or [])
+        for label, old in (('slice', True), ('view', False)):
+            reads, copies, t = run(files, SampleKey[name], old, rounds)
+            print(f'{name} {label:>5}: {reads} buffers from readers, {copies} copied, {t*1e3:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
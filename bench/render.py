@@ -0,0 +1,51 @@
+# python -m bench.render  (from the repo root)
+# Ins.render against tree_to_str(list_to_tree()) on every expression of the samples
+from io import BytesIO
+from time import perf_counter
+from yurislib import fileformat as ff
+from bench import sample_ypfs, SampleKey
+
+
+def exprs(files: dict[str, bytes], key: int):
+    ysvr = ff.YSVR(ff.MRdr(files['ysbin\\ysv.ybn']))
+    yield from (v.initv for v in ysvr.vars if v.typ == 3 and v.initv)
+    kcc = ff.YSCM(ff.MRdr(files['ysbin\\ysc.ybn'])).kcc
+    for name, data in files.items():
+        if name.startswith('ysbin\\yst0'):
+            for cmd in ff.YSTB(BytesIO(data), kcc, key).cmds:
+                yield from (a.dat for a in cmd.args if isinstance(a.dat, list) and a.dat)
+
+
+def main(rounds: int = 3):
+    for name, ypf in sample_ypfs():
+        lsts = list(exprs(dict(ypf.files or []), SampleKey[name]))
+        tyq = ff.InsTyqV200 if ypf.ver < 300 else ff.InsTyqV300
+
+        def var_name(x: int):  # any total naming that keeps the type prefixes
+            return tyq[x & 255]+f'v{x >> 8}'
+        for new_tostr in (False, True):
+            def old(lst: list[ff.Ins]):
+                tree = ff.Ins.list_to_tree(lst, str, var_name, new_tostr)
+                tstr = ff.Ins.tree_to_str(tree)
+                return '('+tstr+')' if tree[0] == '&' and len(tree) == 3 else tstr
+
+            def new(lst: list[ff.Ins]):
+                tstr, top = ff.Ins.render(lst, str, var_name, new_tostr)
+                return '('+tstr+')' if top == '&' else tstr
+            for lst in lsts:
+                assert (a := old(lst)) == (b := new(lst)), f'{lst}: {a} != {b}'
+            times = []
+            for func in (old, new):
+                best = float('inf')
+                for _ in range(rounds):
+                    t = perf_counter()
+                    for lst in lsts:
+                        func(lst)
+                    best = min(best, perf_counter()-t)
+                times.append(best)
+            print(f'{name} to_new_tostr={new_tostr}: {len(lsts)} exprs identical, '
+                  f'tree={times[0]*1e3:.1f}ms render={times[1]*1e3:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
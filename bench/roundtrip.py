@@ -0,0 +1,62 @@
+# python -m bench.roundtrip  (from the repo root)
+# patch text -> ystb_text reads it back, repack -> YPF reads the archive back,
+# YSTBC dump -> load gives the same arrays; asserts, prints one line per sample
+from io import BytesIO
+from collections import ChainMap
+from yurislib import fileformat as ff, text
+from bench import SampleKey, SampleOpt, sample_path
+
+
+def new_text(t: str):  # longer or shorter, so exprs after it move both ways
+    return t[::-1]+'テスト' if len(t) < 4 else t[:len(t)//2]
+
+
+def check(name: str):
+    key, opt = SampleKey[name], SampleOpt[name]
+    with open(sample_path(name, 'ypf'), 'rb') as fp:
+        src = ff.YPF(fp, lazy=True, **opt)
+        recs = list(text.mem_text(src, key))
+        edits = {(r[0], r[2], r[5], r[6]): new_text(r[7]) for r in recs[::7]}
+        # patch -> text
+        new: dict[str, bytes] = {}
+        recs_in = [{'script': s, 'cmd': i, 'arg': j, 'n': n, 'text': t} for (s, i, j, n), t in edits.items()]
+        done = text.game_patch(lambda n: src['ysbin\\'+n], lambda n, d: new.__setitem__('ysbin\\'+n, bytes(d)),
+                               key, recs_in)
+        got = list(text.mem_text(ChainMap(new, src), key))  # type: ignore
+        exp = [r[:7]+(edits.get((r[0], r[2], r[5], r[6]), r[7]),) for r in recs]
+        assert got == exp, f'{name}: patched text differs'
+        r = next(r for r in recs if r[4] == 'str')  # either quote, there is no escape
+        kcc = ff.YSCM(ff.MRdr(src['ysbin\\ysc.ybn'])).kcc
+        try:
+            text.ystb_patch(src[f'ysbin\\yst{r[0]:0>5}.ybn'], kcc, key, [(r[2], r[5], r[6], 'a"b\'c')])
+        except AssertionError:
+            pass
+        else:
+            assert False, f'{name}: a quote inside new text was accepted'
+        # repack -> YPF
+        out = BytesIO()
+        ff.repack(src, out, new, **opt)
+        out.seek(0)
+        back = ff.YPF(out, **opt)
+        assert list(back) == list(src), f'{name}: member names differ'
+        for n, d in back.items():
+            assert d == new.get(n, src[n]), f'{name}: {n} differs after repack'
+    # dump -> load
+    for n in done:
+        y = ff.YSTBC(new['ysbin\\'+n], kcc, key)
+        y.dump(f := BytesIO())
+        z = ff.YSTBC.load(f.getvalue(), kcc)
+        assert (y.ver, y.key, y.exp) == (z.ver, z.key, z.exp), f'{name}: {n} header or exprs differ'
+        for k in ff.YtbcArrs:
+            assert bytes(getattr(y, k)) == bytes(getattr(z, k)), f'{name}: {n} {k} differs after load'
+    print(f'{name}: {len(edits)} edits in {len(done)} scripts, repacked {len(back)} members, '
+          f'{len(done)} YSTBC dumps: ok')
+
+
+def main():
+    for name in SampleOpt:
+        check(name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# python -m bench.suite [--out res.json] [--baseline old.json]  (from the repo root)
+# every stage of extract + decompile timed on its own over the sample archives
+# and, with --synth, over bench.synth games for scaling curves
+import sys
+import json
+import platform
+import tracemalloc
+from io import BytesIO
+from os import path
+from tempfile import TemporaryDirectory
+from time import perf_counter, strftime
+from argparse import ArgumentParser
+from typing import Any, Callable
+from yurislib import fileformat as ff
+from yurislib.decompiler import YEnv, do_ystb
+from bench import SampleKey, SampleOpt, sample_path, synth
+
+Stages = ['ypf_head', 'hash', 'decompress', 'xor_trans', 'ystb', 'parse_buf', 'render', 'emit']
+
+
+def hash_pair(opt: dict, ver: int) -> ff.HashPair:  # what YPF picks when not given
+    return opt.get('hash_name_file') or (
+        ff.NoneHash if ver < 265 else ff.V265Hash if ver < 470 else ff.V470Hash)
+
+
+def measure(run: Callable[[Any], Any], setup: Callable[[], Any], rounds: int):
+    # best of rounds, then one more round under tracemalloc for the peak above start
+    best = float('inf')
+    for _ in range(rounds):
+        arg = setup()
+        t = perf_counter()
+        run(arg)
+        best = min(best, perf_counter()-t)
+    arg = setup()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        run(arg)
+        peak = tracemalloc.get_traced_memory()[1]-base
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+class Game:  # everything the stages need, prepared outside the timings
+    def __init__(self, ypf: bytes, opt: dict, key: int, ycd: bytes | None):
+        self.data, self.opt, self.key = ypf, opt, key
+        y = ff.YPF(BytesIO(ypf), **opt)
+        self.ver, self.ents = y.ver, y.ents
+        self.raw = [y.read_raw(e) for e in y.ents]
+        self.files = dict(y.files or [])
+        self.hash_name, self.hash_file = hash_pair(opt, y.ver)
+        self.names = [e.name.encode(opt.get('name_encoding', ff.CP932)) for e in y.ents]
+        self.yscd = ff.YSCD(ff.Rdr(ycd)) if ycd else None
+        self.ysvr = ff.YSVR(ff.MRdr(self.files['ysbin\\ysv.ybn']))
+        self.yslb = ff.YSLB(ff.MRdr(self.files['ysbin\\ysl.ybn']))
+        self.yscm = ff.YSCM(ff.MRdr(self.files['ysbin\\ysc.ybn']))
+        self.ystl = ff.YSTL(ff.MRdr(self.files['ysbin\\yst_list.ybn']))
+        self.scrs = [(s.idx, self.files[f'ysbin\\yst{s.idx:0>5}.ybn'])
+                     for s in self.ystl.scrs if s.nvar >= 0]
+        self.secs = [ystb[32:] for _, ystb in self.scrs]  # all sections, as xor_trans sees them
+        # decrypted ybns (key 0), so the ystb stage doesn't time xor_trans again
+        self.plain = [d[:32]+b''.join(ff.ystb_sections(d, key)[1:]) for _, d in self.scrs]
+        self.exprs = [a.raw for d in self.plain for c in ff.YSTB(d, self.yscm.kcc, 0).cmds
+                      for a in c.args if a.raw]
+        tyq = ff.InsTyqV200 if self.ver < 300 else ff.InsTyqV300
+        self.var_name = lambda x: tyq[x & 255]+f'v{x >> 8}'  # see bench.render
+        self.lsts = [ff.Ins.parse_buf(b, ff.CP932) for b in self.exprs]
+        self.lhdir = y.f.tell()
+
+    def stages(self):  # name -> (run, setup, input bytes)
+        none = lambda: None
+        kcc, key = self.yscm.kcc, self.key
+
+        def head(_):
+            ff.YPF(BytesIO(self.data), lazy=True, **self.opt)
+
+        def hash(_):
+            for n, e, r in zip(self.names, self.ents, self.raw):
+                self.hash_name(n, 0)  # name hashes aren't kept in YpfEnt, just compute
+                self.hash_file(r, e.hash)
+
+        def decomp(_):
+            for e, r in zip(self.ents, self.raw):
+                _ = e.comp and ff.decompress(r)
+
+        def xor(bufs: list[bytearray]):
+            for b in bufs:
+                ff.xor_trans(b, key)
+
+        def ystb(_):
+            for d in self.plain:
+                ff.YSTB(d, kcc, 0)
+
+        def parse(_):
+            for b in self.exprs:
+                ff.Ins.parse_buf(b, ff.CP932)
+
+        def render(_):
+            for l in self.lsts:
+                ff.Ins.render(l, str, self.var_name, False)
+
+        def emit_setup():  # new YSTBs (Arg caches its decoded expr) and YEnv, an empty InsCache
+            ff.InsCache.dic.clear()
+            return YEnv(self.yscd, self.ysvr, self.yslb, self.yscm), [ff.YSTB(d, kcc, 0) for d in self.plain]
+
+        def emit(setup: tuple[YEnv, list[ff.YSTB]]):  # into real files, as decompile writes them
+            yenv, ystbs = setup
+            with TemporaryDirectory() as tmp:
+                for (i, _), y in zip(self.scrs, ystbs):
+                    with open(path.join(tmp, f'{i}.yst'), 'w', encoding=ff.CP932, newline='\r\n') as f:
+                        do_ystb(yenv, i, y, f)
+        return {
+            'ypf_head': (head, none, self.lhdir),
+            'hash': (hash, none, sum(map(len, self.names))+sum(map(len, self.raw))),
+            'decompress': (decomp, none, sum(e.ul for e in self.ents if e.comp)),
+            'xor_trans': (xor, lambda: [bytearray(s) for s in self.secs], sum(map(len, self.secs))),
+            'ystb': (ystb, none, sum(map(len, self.plain))),
+            'parse_buf': (parse, none, sum(map(len, self.exprs))),
+            'render': (render, none, sum(map(len, self.exprs))),
+            'emit': (emit, emit_setup, sum(len(d) for _, d in self.scrs)),
+        }
+
+
+def run_game(game: Game, rounds: int, only: list[str]):
+    res: dict[str, dict[str, float]] = {}
+    for name, (run, setup, nbytes) in game.stages().items():
+        if name in only:
+            secs, peak = measure(run, setup, rounds)
+            res[name] = {'secs': secs, 'bytes': nbytes, 'mb_s': nbytes/secs/1e6, 'peak': peak}
+    return res
+
+
+def games(sizes: str):  # (name, Game) of the samples, then synth games
+    for name, opt in SampleOpt.items():
+        with open(sample_path(name, 'ypf'), 'rb') as fp, open(sample_path(name, 'ycd'), 'rb') as fc:
+            yield name, Game(fp.read(), opt, SampleKey[name], fc.read())
+    for n in filter(None, sizes.split(',')):
+        spec = synth.Spec(scripts=int(n))
+        synth.write_ypf(fo := BytesIO(), list(spec.names()), (d for _, d in synth.ysbin(spec)), spec.ypf_ver)
+        yield f's{n}', Game(fo.getvalue(), {}, spec.key, None)
+
+
+def compare(cur: dict, base: dict, tol: float):
+    # -> regressions; a stage regresses when it got slower than base by more than tol
+    bad: list[str] = []
+    for game, stages in cur['results'].items():
+        for stage, r in stages.items():
+            if (b := base['results'].get(game, {}).get(stage)) is None:
+                continue
+            ratio = r['secs']/b['secs']
+            mark = ' SLOWER' if ratio > 1+tol else ''
+            print(f'{game:>6} {stage:>10}: {ratio:5.2f}x time, '
+                  f'{r['peak']/max(b['peak'], 1):5.2f}x peak vs baseline{mark}')
+            _ = mark and bad.append(f'{game}/{stage}')
+    return bad
+
+
+def main(argv: list[str] | None = None):
+    ap = ArgumentParser('bench.suite')
+    ap.add_argument('--rounds', type=int, default=5)
+    ap.add_argument('--stages', default=','.join(Stages), help='comma separated, of: '+' '.join(Stages))
+    ap.add_argument('--out', help='write results as json')
+    ap.add_argument('--baseline', help='json from an earlier --out to compare with')
+    ap.add_argument('--tolerance', type=float, default=0.10, help='allowed slowdown, 0.10 = 10%%')
+    ap.add_argument('--synth', default='', help='comma separated script counts, '
+                    'also run on bench.synth games of those sizes (cmds=200, ver=494)')
+    a = ap.parse_args(argv)
+    only = a.stages.split(',')
+    assert not (x := set(only)-set(Stages)), f'unknown stages: {x}'
+    cur = {'meta': {'python': sys.version.split()[0], 'machine': platform.machine(),
+                    'platform': platform.platform(), 'rounds': a.rounds,
+                    'time': strftime('%Y-%m-%dT%H:%M:%S')}, 'results': {}}
+    for name, game in games(a.synth):
+        cur['results'][name] = res = run_game(game, a.rounds, only)
+        for stage, r in res.items():
+            print(f'{name:>6} {stage:>10}: {r['secs']*1e3:9.2f}ms {r['mb_s']:8.1f}MB/s '
+                  f'peak {r['peak']/1e3:8.0f}kB  ({r['bytes']} bytes)')
+    if a.out:
+        with open(a.out, 'w', encoding='utf-8') as f:
+            json.dump(cur, f, indent=1)
+    if a.baseline:
+        with open(a.baseline, 'r', encoding='utf-8') as f:
+            bad = compare(cur, json.load(f), a.tolerance)
+        if bad:
+            print('regressed:', ' '.join(bad))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
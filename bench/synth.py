@@ -0,0 +1,343 @@
+# python -m bench.synth OUT [--scripts N --cmds N ...]  (from the repo root)
+# makes up a game of any size for scaling runs: OUT/ysbin/*.ybn and OUT/synth.ypf
+# everything parses with yurislib and decompiles without a YSCom.ycd
+import zlib
+from os import makedirs, path
+from random import Random
+from argparse import ArgumentParser
+from typing import BinaryIO, Iterable, Iterator
+from yurislib import KEY_200, KEY_300
+from yurislib import fileformat as ff
+
+Cmds = [  # name, arg names; what do_ystb treats specially, and a few plain ones
+    ('IF', []), ('ELSE', []), ('IFEND', []), ('LOOP', ['SET']), ('LOOPEND', []),
+    ('RETURNCODE', []), ('WORD', []), ('END', []), ('LET', []), ('INT', []), ('STR', []),
+    ('MSG', ['TEXT', 'X', 'Y']), ('WAIT', ['TIME']),
+]
+Code = {name: i for i, (name, _) in enumerate(Cmds)}
+BinOps = [0x2A, 0x2F, 0x25, 0x2B, 0x2D, 0x3C, 0x53, 0x3E, 0x5A, 0x3D, 0x21, 0x41, 0x5E, 0x4F, 0x26, 0x7C]
+Words = ['あ', 'い', 'う', 'え', 'お', 'か', 'き', 'く', '漢', '字', '、', '。', 'ab', 'cd', ' ']
+NComVar = 20  # #0-#19, like the system vars of YSCom
+TypInt, TypFlt, TypStr = 1, 2, 3
+
+
+class Spec:
+    __slots__ = ['ver', 'ypf_ver', 'key', 'scripts', 'empty', 'cmds', 'depth', 'vars',
+                 'locals', 'labels', 'blobs', 'blob_size', 'seed']
+
+    def __init__(self, *, ver: int = 494, ypf_ver: int | None = None, key: int | None = None,
+                 scripts: int = 100, empty: int = 1, cmds: int = 200, depth: int = 3,
+                 vars: int = 200, locals: int | None = None, labels: int = 10,
+                 blobs: int = 0, blob_size: int = 1 << 20, seed: int = 1):
+        assert ff.goodver(ver) and ff.goodver(ypf_ver := ypf_ver or ver)
+        assert 0 <= empty <= scripts < 100000
+        # var ins hold idx << 8 | tyq in 3 signed bytes; locals: up to 8 per script,
+        # fewer if that would run out (3 for 10000 scripts)
+        free = (1 << 15)-1-ff.VarUsrMi-vars
+        locals = min(8, free//max(scripts, 1)) if locals is None else locals
+        assert free >= 0 and scripts*locals <= free, 'too many vars'
+        self.ver, self.ypf_ver = ver, ypf_ver
+        self.key = key if key is not None else KEY_200 if ver < 290 else KEY_300
+        self.scripts, self.empty, self.cmds, self.depth = scripts, empty, max(cmds, 1), depth
+        self.vars, self.locals, self.labels = vars, locals, labels
+        self.blobs, self.blob_size, self.seed = blobs, blob_size, seed
+
+    def names(self):  # of every member, in the order ysbin() yields them
+        yield from ('ysbin\\ysc.ybn', 'ysbin\\ysv.ybn')
+        yield from (f'ysbin\\yst{i:0>5}.ybn' for i in range(self.empty, self.scripts))
+        yield from ('ysbin\\ysl.ybn', 'ysbin\\yst_list.ybn')
+        yield from (f'data\\b{i:0>5}.dat' for i in range(self.blobs))
+
+
+def i_ins(code: int, arg: bytes = b''):
+    return ff.SIns.pack(code, len(arg))+arg
+
+
+def i_int(v: int):
+    for code, n in ((0x42, 1), (0x57, 2), (0x49, 4), (0x4C, 8)):
+        if -(1 << (n*8-1)) <= v < 1 << (n*8-1):
+            return i_ins(code, v.to_bytes(n, ff.LE, signed=True))
+    assert False
+
+
+def i_var(idx: int, typ: int):
+    return i_ins(0x48, (idx << 8 | ff.TypToTyq[typ]).to_bytes(3, ff.LE, signed=True))
+
+
+def i_str(s: str):
+    return i_ins(0x4D, ('"'+s+'"').encode(ff.CP932))
+
+
+class Gen:  # expressions and statements of one game
+    def __init__(self, spec: Spec):
+        self.spec = spec
+        self.rng = Random(spec.seed)
+        self.gvars: list[tuple[int, int, int, int, int, bytes]] = []  # scope g_ext scr idx typ initv
+        self.ints: list[int] = []  # var indices usable anywhere
+        self.strs: list[int] = []
+        self.next_local = ff.VarUsrMi+spec.vars
+        rng = self.rng
+        for i in range(NComVar):
+            typ = rng.choice((TypInt, TypInt, TypStr))
+            self.gvars.append((1, 0, 0, i, typ, self.initv(typ)))
+            (self.ints if typ == TypInt else self.strs).append(i)
+        for i in range(ff.VarUsrMi, ff.VarUsrMi+spec.vars):
+            typ = rng.choice((TypInt, TypInt, TypInt, TypFlt, TypStr))
+            scope = rng.choice((1, 1, 1, 2))
+            g_ext = rng.randint(1, 3) if scope == 1 and spec.ver >= 481 else 1
+            scr = rng.randrange(spec.scripts) if scope == 2 else 0
+            self.gvars.append((scope, g_ext, scr, i, typ, self.initv(typ)))
+            _ = typ != TypFlt and (self.ints if typ == TypInt else self.strs).append(i)
+
+    def text(self, lo: int, hi: int):
+        return ''.join(self.rng.choice(Words) for _ in range(self.rng.randint(lo, hi)))
+
+    def initv(self, typ: int):
+        rng = self.rng
+        match typ:
+            case 1: return ff.SSInt[8].pack(rng.randint(-1000, 1000) if rng.random() < .5 else 0)
+            case 2: return ff.F64.pack(rng.random()*100)
+            case _:
+                b = i_str(self.text(1, 6)) if rng.random() < .5 else b''
+                return ff.SUInt[2].pack(len(b))+b
+
+    def int_expr(self, depth: int, ints: list[int]) -> bytes:
+        rng = self.rng
+        if depth <= 0 or rng.random() < .25:
+            match rng.random():
+                case r if r < .5 and ints: return i_var(rng.choice(ints), TypInt)
+                case r if r < .55: return i_ins(0x46, ff.F64.pack(rng.random()*10))
+                case _: return i_int(rng.choice((rng.randint(-9, 99), rng.randint(-1 << 40, 1 << 40))))
+        if rng.random() < .1:
+            return self.int_expr(depth-1, ints)+i_ins(0x52)
+        return self.int_expr(depth-1, ints)+self.int_expr(depth-1, ints)+i_ins(rng.choice(BinOps))
+
+    def str_expr(self, depth: int, strs: list[int]) -> bytes:
+        rng = self.rng
+        if depth <= 0 or rng.random() < .4:
+            return i_var(rng.choice(strs), TypStr) if strs and rng.random() < .4 else i_str(self.text(1, 8))
+        return self.str_expr(depth-1, strs)+self.str_expr(depth-1, strs)+i_ins(0x2B)
+
+
+class Script:  # commands of one YSTB before layout
+    # a cmd is [code, lno, args]; args are ('e', id, aop, expr), ('w', text),
+    # ('t', target cmd index or None) for IF/ELSE/LOOP, ('r', len) for RETURNCODE
+    def __init__(self, gen: Gen, idx: int):
+        self.gen, self.idx = gen, idx
+        self.cmds: list[list] = []
+        self.ints, self.strs = list(gen.ints), list(gen.strs)
+        self.lno = 1
+        self.nvar = self.ntext = 0
+
+    def add(self, name: str, *args: tuple):
+        self.cmds.append(c := [Code[name], self.lno, list(args)])
+        return c
+
+    def newline(self):
+        self.lno += self.gen.rng.choice((1, 1, 1, 2))
+
+    def local(self):
+        i = self.gen.next_local
+        assert i < 1 << 15, 'too many vars'
+        self.gen.next_local += 1
+        self.nvar += 1
+        return i
+
+    def stmt(self, nest: int):
+        gen, rng, d = self.gen, self.gen.rng, self.gen.spec.depth
+        self.newline()
+        match rng.random():
+            case r if r < .3:
+                _ = rng.random() < .3 and self.add('RETURNCODE', ('r', rng.randint(0, 1)))
+                self.add('WORD', ('w', gen.text(4, 40).encode(ff.CP932)))
+                self.ntext += 1
+            case r if r < .45 and self.ints:
+                lhs = i_var(rng.choice(self.ints), TypInt)
+                self.add('LET', ('e', 0, rng.randint(0, 8), lhs), ('e', 1, 0, gen.int_expr(d, self.ints)))
+            case r if r < .55 and self.nvar < gen.spec.locals:
+                typ = rng.choice((TypInt, TypStr))
+                lhs = i_var(i := self.local(), typ)
+                match rng.random():
+                    case r if r < .3: rhs = i_ins(0x4C, bytes(8))  # i64 0: no init
+                    case _ if typ == TypInt: rhs = gen.int_expr(d, self.ints)
+                    case _: rhs = gen.str_expr(d, self.strs)
+                self.add('INT' if typ == TypInt else 'STR', ('e', 0, 0, lhs), ('e', 1, 0, rhs))
+                (self.ints if typ == TypInt else self.strs).append(i)
+            case r if r < .55:  # locals used up, assign to one already there
+                typ, vs = rng.choice(((TypInt, self.ints), (TypStr, self.strs)))
+                rhs = gen.int_expr(d, self.ints) if typ == TypInt else gen.str_expr(d, self.strs)
+                if vs:
+                    self.add('LET', ('e', 0, 0, i_var(rng.choice(vs), typ)), ('e', 1, 0, rhs))
+                else:
+                    self.add('WAIT', ('e', 0, 0, i_int(rng.randint(0, 1000))))
+            case r if r < .7:
+                args = [('e', 0, 0, gen.str_expr(d, self.strs))]
+                args += [('e', j, 0, gen.int_expr(1, self.ints)) for j in (1, 2) if rng.random() < .6]
+                self.add('MSG', *args)
+            case r if r < .8: self.add('WAIT', ('e', 0, 0, gen.int_expr(1, self.ints)))
+            case r if r < .92 and nest < 2:
+                c_if = self.add('IF', ('e', 0, 0, gen.int_expr(d, self.ints)), ('t', None), ('t', None))
+                self.block(nest)
+                if rng.random() < .4:
+                    self.newline()
+                    c_if[2][1] = ('t', len(self.cmds))
+                    self.add('ELSE')
+                    self.block(nest)
+                self.newline()
+                c_if[2][2] = ('t', len(self.cmds))
+                self.add('IFEND')
+            case _ if nest < 2:
+                cnt = i_int(-1) if rng.random() < .5 else gen.int_expr(1, self.ints)
+                c_loop = self.add('LOOP', ('e', 0, 0, cnt), ('t', None))
+                self.block(nest)
+                self.newline()
+                c_loop[2][1] = ('t', len(self.cmds))
+                self.add('LOOPEND')
+            case _: self.add('WAIT', ('e', 0, 0, i_int(rng.randint(0, 1000))))
+
+    def block(self, nest: int):
+        for _ in range(self.gen.rng.randint(1, 3)):
+            self.stmt(nest+1)
+
+    def make(self):
+        while len(self.cmds) < self.gen.spec.cmds-1:
+            self.stmt(0)
+        self.newline()
+        self.add('END')
+        return self
+
+    def ystb(self, ver: int, key: int):  # -> ybn, cmd offsets (what labels point at)
+        v300 = ver >= 300
+        rsize = 12 if v300 else 8 if ver == 290 else 4
+        offs: list[int] = []  # of cmds, bytes before V300, indices since
+        curs: list[int] = []  # expr bytes before cmd
+        o = e = 0
+        for i, (code, _, args) in enumerate(self.cmds):
+            offs.append(i if v300 else o)
+            curs.append(e)
+            o += 6+sum(rsize if a[0] == 'r' else 12 for a in args)
+            e += sum(len(a[-1]) for a in args if a[0] in 'ew')
+        dcmd, darg, dexp, dlno = bytearray(), bytearray(), bytearray(), bytearray()
+        for code, lno, args in self.cmds:
+            if v300:
+                dcmd += ff.SCmdV300.pack(code, len(args), 0)
+                dlno += ff.SUInt[4].pack(lno)
+            else:
+                dcmd += ff.SCmdV200.pack(code, len(args), lno)
+            da = darg if v300 else dcmd
+            for a in args:
+                match a:
+                    case ('e', id, aop, b):
+                        da += ff.SArg.pack(id, 0, aop, len(b), len(dexp))
+                        dexp += b
+                    case ('w', b):
+                        da += ff.SArg.pack(0, 0, 0, len(b), len(dexp))
+                        dexp += b
+                    case ('t', None): da += ff.SArg.pack(0, 0, 0, 0, 0)
+                    case ('t', j): da += ff.SArg.pack(0, 0, 0, offs[j], curs[j])
+                    case ('r', n) if v300: da += ff.SArg.pack(0, 0, 0, n, 0)
+                    case ('r', n) if ver == 290: da += ff.SArgR290.pack(0, 0, 0, n)
+                    case ('r', n): da += ff.SArgR2xx.pack(0, 0, 0)
+        n, lc, la, le = len(self.cmds), len(dcmd), len(darg), len(dexp)
+        if v300:
+            head = ff.SYtbHead.pack(ff.YtbMagic, ver, n, lc, la, le, len(dlno), 0)
+        else:
+            head = ff.SYtbHead.pack(ff.YtbMagic, ver, lc, le, 32+lc, 0, 0, 0)
+        secs = (dcmd, darg, dexp, dlno)
+        return head+b''.join(ff.xor_trans(s, key) for s in secs), offs
+
+
+def yscm_bytes(ver: int):
+    b = bytearray(ff.SYscHead.pack(ff.YscMagic, ver, len(Cmds), 0))
+    for name, args in Cmds:
+        b += name.encode()+b'\0'+bytes([len(args)])
+        for a in args:
+            b += a.encode()+b'\0'+bytes([0, 0])
+    for i in range(ff.NErrStr):
+        b += f'error {i}'.encode()+b'\0'
+    return bytes(b+bytes(256))
+
+
+def ysvr_bytes(ver: int, gvars: list[tuple[int, int, int, int, int, bytes]]):
+    b = bytearray(ff.SYsvHead.pack(ff.YsvMagic, ver, len(gvars)))
+    for scope, g_ext, scr, idx, typ, initv in gvars:
+        if ver >= 481:
+            b += ff.SvarV481.pack(scope, g_ext, scr, idx, typ, 0)
+        else:
+            b += ff.SVarV000.pack(scope, scr, idx, typ, 0)
+        b += initv
+    return bytes(b)
+
+
+def yslb_bytes(ver: int, lbls: list[tuple[str, int, int]]):
+    b = bytearray(ff.SYslHead.pack(ff.YslMagic, ver, len(lbls)))
+    b += bytes(4 * 256)
+    for name, ip, scr in lbls:
+        nb = name.encode(ff.CP932)
+        b += bytes([len(nb)])+nb+ff.SLbl.pack(zlib.crc32(nb), ip, scr, 0, 0)
+    return bytes(b)
+
+
+def ystl_bytes(ver: int, scrs: list[tuple[str, int, int, int]]):
+    b = bytearray(ff.SYtlHead.pack(ff.YtlMagic, ver, len(scrs)))
+    for i, (p, nvar, nlbl, ntext) in enumerate(scrs):
+        pb = p.encode(ff.CP932)
+        b += ff.U32x2.pack(i, len(pb))+pb
+        b += ff.SScrV470.pack(0, nvar, nlbl, ntext) if ver >= 470 else ff.SScrV200.pack(0, nvar, nlbl)
+    return bytes(b)
+
+
+def ysbin(spec: Spec) -> Iterator[tuple[str, bytes]]:  # (name, data) in spec.names() order
+    gen, ver = Gen(spec), spec.ver
+    rng = gen.rng
+    yield 'ysbin\\ysc.ybn', yscm_bytes(ver)
+    yield 'ysbin\\ysv.ybn', ysvr_bytes(ver, gen.gvars)
+    lbls: list[tuple[str, int, int]] = []
+    scrs: list[tuple[str, int, int, int]] = [(f'empty{i}.yst', -1, 0, 0) for i in range(spec.empty)]
+    for i in range(spec.empty, spec.scripts):
+        s = Script(gen, i).make()
+        data, offs = s.ystb(ver, spec.key)
+        for j in range(spec.labels):
+            lbls.append((f'L{i}_{j}', rng.choice(offs), i))
+        scrs.append((f'scr\\s{i:0>5}.yst', s.nvar, spec.labels, s.ntext))
+        yield f'ysbin\\yst{i:0>5}.ybn', data
+    yield 'ysbin\\ysl.ybn', yslb_bytes(ver, lbls)
+    yield 'ysbin\\yst_list.ybn', ystl_bytes(ver, scrs)
+    for i in range(spec.blobs):
+        yield f'data\\b{i:0>5}.dat', rng.randbytes(spec.blob_size)
+
+
+def write_ypf(fo: BinaryIO, names: list[str], datas: Iterable[bytes], ver: int):
+    # what YPF(fo) reads back with default options; ybn are compressed, others stored
+    ff.write_ypf(fo, names, datas, ver, comp=lambda name, _: name.endswith('.ybn'))
+
+
+def main(argv: list[str] | None = None):
+    ap = ArgumentParser('bench.synth')
+    ap.add_argument('out')
+    for k, v in Spec.__init__.__kwdefaults__.items():  # type: ignore
+        ap.add_argument('--'+k.replace('_', '-'), type=lambda s: int(s, 0), default=v)  # 0x.. too
+    ap.add_argument('--no-ysbin', action='store_true', help="don't write OUT/ysbin")
+    ap.add_argument('--no-ypf', action='store_true', help="don't write OUT/synth.ypf")
+    a = vars(ap.parse_args(argv))
+    out, no_ysbin, no_ypf = a.pop('out'), a.pop('no_ysbin'), a.pop('no_ypf')
+    spec = Spec(**a)
+    makedirs(ydir := path.join(out, 'ysbin'), exist_ok=True)
+
+    def files():
+        for name, data in ysbin(spec):
+            if not no_ysbin and name.startswith('ysbin\\'):
+                with open(path.join(ydir, name[6:]), 'wb') as f:
+                    f.write(data)
+            yield data
+    if no_ypf:
+        for _ in files():
+            pass
+    else:
+        with open(path.join(out, 'synth.ypf'), 'wb') as fo:
+            write_ypf(fo, list(spec.names()), files(), spec.ypf_ver)
+    print(f'ver={spec.ver} key={spec.key:#010x} scripts={spec.scripts} -> {out}')
+
+
+if __name__ == '__main__':
+    main()
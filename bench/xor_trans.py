@@ -0,0 +1,51 @@
+# python -m bench.xor_trans  (from the repo root)
+from time import perf_counter
+from yurislib import fileformat as ff
+from bench import sample_ypfs, SampleKey
+
+
+def xor_trans_loop(bs: bytearray, key: int):  # the per-byte loop xor_trans used to be
+    o = len(bs) & ~3
+    b0, b1, b2, b3 = k = key.to_bytes(4, 'big')
+    for i in range(0, o, 4):
+        bs[i+0] ^= b0
+        bs[i+1] ^= b1
+        bs[i+2] ^= b2
+        bs[i+3] ^= b3
+    for j in range(len(bs) & 3):
+        bs[o+j] ^= k[j]
+    return bs
+
+
+def timeit(func, secs: list[bytes], key: int, rounds: int):
+    best = float('inf')
+    for _ in range(rounds):
+        bufs = [bytearray(s) for s in secs]
+        t = perf_counter()
+        for b in bufs:
+            func(b, key)
+        best = min(best, perf_counter()-t)
+    return best
+
+
+def main(rounds: int = 5):
+    for name, ypf in sample_ypfs():
+        key = SampleKey[name]
+        # each script body (everything after the 32-byte header) as one buffer
+        secs = [data[32:] for n, data in ypf.files if n.startswith('ysbin\\yst0')]
+        total = sum(map(len, secs))
+        codec = ff.XorCodec(key)
+        for s in secs:
+            enc = codec.encrypt(s)
+            assert xor_trans_loop(bytearray(s), key) == enc
+            assert codec.decrypt(enc) == s
+        t_loop = timeit(xor_trans_loop, secs, key, rounds)
+        t_fast = timeit(ff.xor_trans, secs, key, rounds)
+        print(f'{name}: {len(secs)} scripts, {total} bytes, '
+              f'loop={t_loop*1e3:.2f}ms ({total/t_loop/1e6:.1f}MB/s), '
+              f'codec={t_fast*1e3:.2f}ms ({total/t_fast/1e6:.1f}MB/s), '
+              f'speedup={t_loop/t_fast:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# python -m bench.ystb_mem  (from the repo root)
+import tracemalloc
+from io import BytesIO
+from yurislib import fileformat as ff
+from bench import sample_ypfs, SampleKey
+
+
+def load_all(files: dict[str, bytes], key: int, cls: type, touch: bool):
+    kcc = ff.YSCM(ff.MRdr(files['ysbin\\ysc.ybn'])).kcc
+    scrs = [cls(BytesIO(d), kcc, key) for n, d in files.items() if n.startswith('ysbin\\yst0')]
+    if touch:  # decode every expression, as a full analysis would
+        for s in scrs:
+            for c in s.cmds:
+                for a in c.args:
+                    a.dat
+    return scrs
+
+
+def retained(files: dict[str, bytes], key: int, cls: type, touch: bool):
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        scrs = load_all(files, key, cls, touch)
+        return tracemalloc.get_traced_memory()[0]-base, scrs
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    for name, ypf in sample_ypfs():
+        files, key = dict(ypf.files or []), SampleKey[name]
+        for label, cls, touch in (('YSTB, exprs decoded', ff.YSTB, True),
+                                  ('YSTB, lazy exprs', ff.YSTB, False),
+                                  ('YSTBC', ff.YSTBC, False)):
+            size, scrs = retained(files, key, cls, touch)
+            extra = f', nbytes()={sum(s.nbytes() for s in scrs)/1e3:.0f} kB' if cls is ff.YSTBC else ''
+            print(f'{name} {label:>20}: {size/1e3:8.0f} kB retained{extra}')
+
+
+if __name__ == '__main__':
+    main()
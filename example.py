@@ -31,3 +31,7 @@ with open('example-files/v494.ycd', 'rb') as fp:
 y_decompile('example-files/v494/ysbin', 'example-out/v494', yscd, KEY_300,
             i_encoding='cp932',
             o_encoding='cp932')
+
+# 3. Repack an archive with some members replaced, the others are copied as stored
+# with open('example-files/v255.ypf', 'rb') as fp, open('example-out/v255.ypf', 'wb') as fo:
+#     fileformat.repack(YPF(fp, lazy=True), fo, {'ysbin\\ysc.ybn': new_ysc})
@@ -1,6 +1,7 @@
 from .fileformat import *
 from .decompiler import *
 y_decompile = decompile
+y_decompile_mem = decompile_mem
 KEY_200 = 0x07B4024A
 KEY_300 = 0xD36FAC96
-__all__ = ['YPF', 'Rdr', 'YSCD', 'y_decompile', 'CP932', 'KEY_200', 'KEY_300']
+__all__ = ['YPF', 'Rdr', 'YSCD', 'y_decompile', 'y_decompile_mem', 'CP932', 'KEY_200', 'KEY_300']
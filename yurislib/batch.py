@@ -0,0 +1,243 @@
+# python -m yurislib.batch manifest.json [--jobs N] [--report report.json]
+# many games in one run: every archive extraction and every game's decompile is
+# split into `split` parts (every split-th member or script), each part is a unit of
+# work, all units share one process pool of `jobs`, a failing unit only fails
+# itself; the report has each unit's outcome and the totals, extract and decompile
+# apart (extracted bytes and script bytes are different work)
+# with split > 1 every archive's entry table and the game's ysv/ysl/ysc/yst_list
+# are parsed once, before the units run, into the game's cache; the parts read
+# them back from there instead of each parsing them again
+#
+# manifest: {"jobs": 4, "report": "report.json", "games": [{  # report: relative to the manifest
+#   "name": "title",                        # default: index in games
+#   "ypf": ["data.ypf", "bgm.ypf"],         # archives, relative to the manifest
+#   "ypf_opt": {"name_encoding": "cp932", "name_size_trans": "NLTransV000",
+#               "name_byte_trans": "NameXorV000", "hash_name_file": "V470Hash"},
+#   "ypf_index": false,                     # keep a .ypfidx next to each archive
+#   "split": 4,                             # parts per archive and decompile, default: jobs
+#   "cache": "out/title/cache",             # parsed tables (PCache, .ypfidx) the parts share,
+#                                           # default with split > 1: .yuris_cache/NAME
+#   "extract": "out/title/files",           # extract every archive here, optional
+#   "decompile": "out/title/src",           # decompile here, optional
+#   "ysbin": "path/to/ysbin",               # decompile from this dir, default: from the
+#                                           # archive holding ysbin\yst_list.ybn
+#   "ycd": "YSCom.ycd", "key": "KEY_300",   # key: KEY_200, KEY_300 or a number
+#   "i_encoding": "cp932", "o_encoding": "cp932", "to_new_tostr": false}]}
+import sys
+import json
+import traceback
+from types import EllipsisType
+from contextlib import ExitStack
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .fileformat import *
+from .decompiler import decompile, decompile_mem
+from . import fileformat, KEY_200, KEY_300
+
+Keys = {'KEY_200': KEY_200, 'KEY_300': KEY_300}
+OptTables = {  # ypf_opt values given by name
+    'name_size_trans': ('NLTransV000', 'NLTransV500'),
+    'name_byte_trans': ('NameXorV000', 'NameXorV290', 'NameXorV500'),
+    'hash_name_file': ('NoneHash', 'V265Hash', 'V470Hash'),
+}
+DecOpts = ('i_encoding', 'o_encoding', 'to_new_tostr')
+Unit = dict[str, Any]
+
+
+def ypf_opt(opt: dict[str, Any]):
+    ret: dict[str, Any] = {}
+    for k, v in opt.items():
+        if k in OptTables:
+            assert v in OptTables[k], f'ypf_opt.{k}: unknown {v}, one of {OptTables[k]}'
+            v = getattr(fileformat, v)
+        else:
+            assert k == 'name_encoding', f'ypf_opt: unknown {k}'
+        ret[k] = v
+    return ret
+
+
+def open_ypf(fp: BinaryIO, opt: dict[str, Any], index: bool, cache: str | None = None):
+    # index next to the archive, else in the cache if any
+    idx = fp.name+'.ypfidx' if index else cache and path.join(cache, path.basename(fp.name)+'.ypfidx')
+    _ = idx and makedirs(path.dirname(idx), exist_ok=True)
+    return YPF(fp, lazy=True, index=idx, **opt)
+
+
+def game_key(key: str | int):
+    if isinstance(key, int):
+        return key
+    return Keys[key] if key in Keys else int(key, 0)
+
+
+def units(man: dict[str, Any], root: str, split: int = 1) -> list[Unit]:
+    # every unit is self-contained (json-able, paths absolute) and runs in any worker
+    # part [k, n]: every n-th member or script from the k-th, found by the worker itself
+    def p(x: str):
+        return path.join(root, x)
+    ret: list[Unit] = []
+    for i, g in enumerate(man['games']):
+        name = str(g.get('name', i))
+        ypfs = [p(y) for y in g.get('ypf', [])]
+        opt = g.get('ypf_opt', {})
+        idx = bool(g.get('ypf_index'))
+        n = max(int(g.get('split', split)), 1)
+        cache = p(g['cache']) if g.get('cache') else path.join(root, '.yuris_cache', name) if n > 1 else None
+        if (xdir := g.get('extract')):
+            ret.extend({'game': name, 'kind': 'extract', 'ypf': y, 'ypf_opt': opt, 'ypf_index': idx,
+                        'cache': cache, 'out': path.join(p(xdir), path.splitext(path.basename(y))[0]),
+                        'part': [k, n]} for y in ypfs for k in range(n))
+        if (ddir := g.get('decompile')):
+            ret.extend({'game': name, 'kind': 'decompile', 'ypfs': ypfs, 'ypf_opt': opt, 'ypf_index': idx,
+                        'cache': cache,
+                        'ysbin': g.get('ysbin') and p(g['ysbin']), 'out': p(ddir),
+                        'ycd': g.get('ycd') and p(g['ycd']), 'key': g.get('key', 'KEY_300'),
+                        'part': [k, n], **{k: g[k] for k in DecOpts if k in g}} for k in range(n))
+    for i, u in enumerate(ret):
+        u['idx'] = i
+    return ret
+
+
+def ysbin_reader(u: Unit, opt: dict[str, Any], stack: ExitStack):
+    # -> read: ybn name -> data, the archive holding ysbin (None for a dir), YPF or None
+    if u['ysbin']:
+        def read(name: str):
+            with open(path.join(u['ysbin'], name), 'rb') as fp:
+                return fp.read()
+        return read, None, None
+    for y in u['ypfs']:
+        fp = stack.enter_context(open(y, 'rb'))
+        if 'ysbin\\yst_list.ybn' in (ypf := open_ypf(fp, opt, u['ypf_index'], u['cache'])):
+            return (lambda name: ypf['ysbin\\'+name]), y, ypf
+        fp.close()
+    assert False, 'no archive holds ysbin\\yst_list.ybn, give "ysbin"'
+
+
+def prime(u: Unit):
+    # parse what every part of u's game would parse again into the cache: entry
+    # tables (index files) and for a decompile ysv/ysl/ysc/yst_list; best effort,
+    # a unit that fails here fails again by itself and says why
+    try:
+        opt = ypf_opt(u['ypf_opt'])
+        if u['kind'] == 'extract':
+            with open(u['ypf'], 'rb') as fp:
+                open_ypf(fp, opt, u['ypf_index'], u['cache'])
+            return
+        with ExitStack() as stack:
+            read, _, _ = ysbin_reader(u, opt, stack)
+            pc, enc = PCache(path.join(u['cache'], 'pcache')), u.get('i_encoding', CP932)
+            for cls, name in ((YSVR, 'ysv'), (YSLB, 'ysl'), (YSCM, 'ysc'), (YSTL, 'yst_list')):
+                pc.parse(cls, read(f'{name}.ybn'), enc)
+    except Exception:
+        pass
+
+
+def run_unit(u: Unit) -> Unit:  # never raises, failures go into the result
+    t = perf_counter()
+    summ = Summary()
+    res: Unit = {'idx': u['idx'], 'game': u['game'], 'kind': u['kind'], 'part': u['part'], 'ok': False}
+    k, n = u['part']
+    try:
+        opt = ypf_opt(u['ypf_opt'])
+        if u['kind'] == 'extract':
+            res['ypf'] = u['ypf']
+            with open(u['ypf'], 'rb') as fp:
+                ypf = open_ypf(fp, opt, u['ypf_index'], u['cache'])
+                ypf.extract(u['out'], None, observer=summ, members=range(k, len(ypf.ents), n))
+            ends = summ.report().get('extract_end', {})
+            res.update(files=ends.get('files', 0), bytes=ends.get('bytes', 0))
+        else:
+            yscd = None
+            if u['ycd']:
+                with open(u['ycd'], 'rb') as fp:
+                    yscd = YSCD(MRdr(fp.read()))
+            kw = {o: u[o] for o in DecOpts if o in u}
+            kw['part'] = (k, n)
+            kw['pcache_dir'] = u['cache'] and path.join(u['cache'], 'pcache')
+            key = game_key(u['key'])
+            if u['ysbin']:
+                decompile(u['ysbin'], u['out'], yscd, key, log=None, observer=summ, **kw)
+            else:
+                with ExitStack() as stack:
+                    _, res['ypf'], ypf = ysbin_reader(u, opt, stack)
+                    decompile_mem(ypf, u['out'], yscd, key, log=None, observer=summ, **kw)
+            rep = summ.report()
+            res.update(scripts=rep.get('decompile_end', {}).get('decompiled', 0),
+                       bytes=rep.get('script_end', {}).get('bytes', 0))
+        res['ok'] = True
+    except Exception as x:
+        res['error'] = ''.join(traceback.format_exception_only(x)).strip()
+        res['trace'] = traceback.format_exc()
+    res['secs'] = perf_counter()-t
+    return res
+
+
+def run(man: dict[str, Any], root: str = '.', *, jobs: int | None = None,
+        log: TextIO | None | EllipsisType = ...) -> dict[str, Any]:
+    log = sys.stdout if log is ... else log  # at call time, as _decompile
+    jobs = jobs or man.get('jobs', 1)
+    todo = units(man, root, jobs)
+    t = perf_counter()
+    for u in todo:  # once per archive or game, in this process
+        _ = u['cache'] and u['part'][0] == 0 and prime(u)
+    if jobs > 1:  # each unit is a process: zlib, parsing and rendering all hold the GIL
+        with ProcessPoolExecutor(jobs) as pool:
+            futs = {pool.submit(run_unit, u): u for u in todo}
+            done = []
+            for f in as_completed(futs):
+                try:
+                    r = f.result()
+                except Exception as x:  # the worker itself died
+                    u = futs[f]
+                    r = {'idx': u['idx'], 'game': u['game'], 'kind': u['kind'], 'part': u['part'],
+                         'ok': False, 'error': f'worker: {x!r}', 'secs': 0.0}
+                done.append(r)
+                _ = log and log.write(unit_line(r))
+    else:
+        done = []
+        for u in todo:
+            done.append(r := run_unit(u))
+            _ = log and log.write(unit_line(r))
+    wall = perf_counter()-t
+    fail = [r for r in done if not r['ok']]
+    done.sort(key=lambda r: r['idx'])  # manifest order
+    rep = {'units': len(done), 'failed': len(fail), 'jobs': jobs, 'secs': wall}
+    for kind, count in (('extract', 'files'), ('decompile', 'scripts')):
+        rs = [r for r in done if r['kind'] == kind]
+        size, secs = sum(r.get('bytes', 0) for r in rs), sum(r['secs'] for r in rs)
+        # secs: summed over units, so mb_s is per worker
+        rep[kind] = {'units': len(rs), count: sum(r.get(count, 0) for r in rs), 'bytes': size,
+                     'secs': secs, 'mb_s': size/1e6/(secs or 1e-9)}
+        _ = log and rs and log.write(f'{kind}: {len(rs)} units, {rep[kind][count]} {count}, '
+                                     f'{size/1e6:.2f} MB in {secs:.2f} unit-s, {rep[kind]["mb_s"]:.1f} MB/s\n')
+    rep['results'] = done
+    _ = log and log.write(f'{len(done)} units, {len(fail)} failed in {wall:.2f}s\n')
+    return rep
+
+
+def unit_line(r: Unit):
+    what = f'{r["game"]} {r["kind"]}' + (f' {path.basename(r["ypf"])}' if r.get('ypf') else '')
+    what += f' {r["part"][0]+1}/{r["part"][1]}' if r['part'][1] > 1 else ''
+    if r['ok']:
+        n = f'{r["files"]} files' if 'files' in r else f'{r.get("scripts", 0)} scripts'
+        return f'{what}: ok, {n}, {r["secs"]:.2f}s\n'
+    return f'{what}: FAILED {r["error"]}\n'
+
+
+def main(argv: list[str] | None = None):
+    ap = ArgumentParser('yurislib.batch')
+    ap.add_argument('manifest')
+    ap.add_argument('--jobs', type=int, help='overrides the manifest')
+    ap.add_argument('--report', help='overrides the manifest')
+    a = ap.parse_args(argv)
+    with open(a.manifest, 'r', encoding='utf-8') as f:
+        man = json.load(f)
+    root = path.dirname(path.abspath(a.manifest))
+    rep = run(man, root, jobs=a.jobs)
+    if (rpath := a.report or man.get('report') and path.join(root, man['report'])):
+        with open(rpath, 'w', encoding='utf-8') as f:
+            json.dump(rep, f, ensure_ascii=False, indent=1)
+    return 1 if rep['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
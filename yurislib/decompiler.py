@@ -1,8 +1,14 @@
 from .fileformat import *
+import sys
+import pickle
+from types import EllipsisType
+from hashlib import sha256
+from shutil import copyfile, rmtree
+from concurrent.futures import ProcessPoolExecutor
 
 
 class YEnv:
-    __slots__ = ['ver', 'vars', 'lbls', 'cmds', 'vtyq', 'ysvr', 'global_yst', 'to_new_tostr']
+    __slots__ = ['ver', 'vars', 'lbls', 'cmds', 'vtyq', 'ysvr', 'global_yst', 'to_new_tostr', 'rcache', 'defd']
     ver: int
     vars: list[str | None]  # Nones are non-existent comvars and locals
     lbls: defdict[int, defdict[int, list[str]]]  # scr_idx -> offset -> name[]
@@ -11,9 +17,14 @@ class YEnv:
     ysvr: YSVR
     global_yst: str | None
     to_new_tostr: bool
+    rcache: LRU  # expr bytes -> (argstr, var indices it used)
+    defd: list[int]  # indices of the locals defined so far, in order
 
-    def __init__(self, yscd: YSCD | None, ysvr: YSVR, yslb: YSLB, yscm: YSCM, *, to_new_tostr: bool = False):
+    def __init__(self, yscd: YSCD | None, ysvr: YSVR, yslb: YSLB, yscm: YSCM, *,
+                 to_new_tostr: bool = False, rcache_size: int = 1 << 16):
         assert (ver := ysvr.ver) == yslb.ver, f'version mismatch: ysvr:{ver}, yslb:{yslb.ver}'
+        self.rcache = LRU(rcache_size)
+        self.defd = []
         max_vidx = max(v.var_idx for v in ysvr.vars)
         vars: list[str | None] = [None] * (max_vidx+1)
         self.ver = ver
@@ -101,34 +112,69 @@ class YEnv:
         assert self.vars[idx] == None, f'already defined: x={hex(x)}'
         assert tyqch == typch, f'type mismatch: ins={tyqch} cmd={TypChar[typ]}'
         ret = self.vars[idx] = f'{tyqch}v{TypName[typ]}{idx}'
+        self.defd.append(idx)
         return ret
 
-    def dat_to_argstr(self, lst: list[Ins]):
-        tree = Ins.list_to_tree(lst, str, self.ins_get_var, self.to_new_tostr)
-        tstr = Ins.tree_to_str(tree)
-        return '('+tstr+')' if tree[0] == '&' and len(tree) == 3 else tstr
+    def dat_to_argstr(self, lst: Sequence[Ins], var_name: Callable[[int], str] | None = None):
+        tstr, top = Ins.render(lst, str, var_name or self.ins_get_var, self.to_new_tostr)
+        return '('+tstr+')' if top == '&' else tstr
+
+    def arg_to_argstr(self, arg: Arg | ArgView):
+        # dat_to_argstr through rcache, keyed by the raw expr bytes
+        # vars entries are write-once (see ins_def_local), so a cached string stays
+        # right as long as every var it used is defined now; else render again
+        if (raw := arg.raw) is None:
+            assert isinstance(dat := arg.dat, tuple)
+            return self.dat_to_argstr(dat)
+        vars = self.vars
+        if (hit := self.rcache.get(raw)) and all(i < len(vars) and vars[i] for i in hit[1]):
+            return hit[0]
+        used: set[int] = set()
+
+        def var_name(x: int):
+            used.add(x >> 8)
+            return self.ins_get_var(x)
+        assert isinstance(dat := arg.dat, tuple)
+        self.rcache.put(raw, (ret := self.dat_to_argstr(dat, var_name), tuple(used)))
+        return ret
 
 
 DefLet = {*DefCmdTyp.keys(), 'LET'}
 
 
-def do_ystb(yenv: YEnv, scr_idx: int, ystb: YSTB, f: TextIO):
+def do_ystb(yenv: YEnv, scr_idx: int, ystb: YSTB | YSTBC, f: TextIO):
     ysvr = yenv.ysvr
     lbls = dict(yenv.lbls[scr_idx].items())  # offset -> name[]
-    lines: list[list[str]] = [[] for _ in range(max(c.lno for c in ystb.cmds))]
     preps: list[str] = []
-    prev_lno = 1
+    # lines are written as soon as a later line starts, only the current one and
+    # the one before it (labels may go back there) are kept
+    nline = 0  # written
+
+    def emit(line: list[str]):
+        nonlocal nline
+        f.write('\n'+';'.join(line) if nline else ';'.join(line))  # no newline after
+        nline += 1
+    lno = 1
+    curline: list[str] = []
+    prevline: list[str] | None = None  # line lno-1, None at line 1
     for i, cmd in enumerate(ystb.cmds):
-        assert cmd.lno >= prev_lno, 'lno not increasing!'
-        lidx = cmd.lno-1
-        curline = lines[lidx]
+        if (n := cmd.lno) != lno:
+            assert n > lno, 'lno not increasing!'
+            if prevline is not None:
+                emit(prevline)
+            if n > lno+1:
+                emit(curline)
+                for _ in range(lno+1, n-1):
+                    emit([])
+                curline = []
+            prevline, curline, lno = curline, [], n
         if len(preps):
             curline.extend(preps)
             preps.clear()
         if (off_lbls := lbls.get(cmd.off)):
             del lbls[cmd.off]
             lbliter = ('#'+name for name in off_lbls)
-            if len(curline) or lidx == 0 or len(prevline := lines[lidx-1]):
+            if len(curline) or prevline is None or len(prevline):
                 curline.extend(lbliter)
             else:
                 prevline.extend(lbliter)
@@ -138,14 +184,13 @@ def do_ystb(yenv: YEnv, scr_idx: int, ystb: YSTB, f: TextIO):
         match cmd_name:
             case 'IFBLEND': assert narg == 0
             case 'IF' | 'ELSE' if narg == 3:
-                assert isinstance(dat := cmd.args[0].dat, list)
-                curline.append(f'{cmd_name}[{yenv.dat_to_argstr(dat)}]')
+                curline.append(f'{cmd_name}[{yenv.arg_to_argstr(args[0])}]')
             case 'LOOP' if narg == 2:
-                assert isinstance(dat := cmd.args[0].dat, list)
-                if str(dat) == '[(i8:-0x1=-1)]':  # depends on Ins.__repr__
+                assert isinstance(dat := cmd.args[0].dat, tuple)
+                if str(list(dat)) == '[(i8:-0x1=-1)]':  # depends on Ins.__repr__
                     curline.append('LOOP[]')
                     continue
-                curline.append(f'LOOP[SET={yenv.dat_to_argstr(dat)}]')
+                curline.append(f'LOOP[SET={yenv.arg_to_argstr(args[0])}]')
             case 'ELSE':
                 assert narg == 0
                 curline.append('ELSE[]')
@@ -165,15 +210,15 @@ def do_ystb(yenv: YEnv, scr_idx: int, ystb: YSTB, f: TextIO):
                 assert narg == 2
                 lhs, rhs = args
                 assert rhs.aop == 0
-                assert isinstance(lhsdat := lhs.dat, list)
-                assert isinstance(rhsdat := rhs.dat, list)
+                assert isinstance(lhsdat := lhs.dat, tuple)
+                assert isinstance(rhsdat := rhs.dat, tuple)
                 if deflet in DefLclTyp:
                     ins = lhsdat[0]
                     assert ins.op in ('idxbeg', 'var')
                     assert isinstance(insx := ins.arg, int)
                     yenv.ins_def_local(insx, DefLclTyp[deflet])
-                lhsstr = yenv.dat_to_argstr(lhsdat)
-                rhsstr = yenv.dat_to_argstr(rhsdat)
+                lhsstr = yenv.arg_to_argstr(lhs)
+                rhsstr = yenv.arg_to_argstr(rhs)
                 if deflet == 'LET':
                     curline.append(f'{lhsstr}{lhs.aop_str}{rhsstr}')
                 else:
@@ -181,7 +226,7 @@ def do_ystb(yenv: YEnv, scr_idx: int, ystb: YSTB, f: TextIO):
                     assert lhs.aop == 0
                     assert ins.op in ('idxbeg', 'var')
                     assert isinstance(insx := ins.arg, int)
-                    n_noinit = str(rhsdat) == '[(i64:0x0=0)]'  # Ins.__repr__
+                    n_noinit = str(list(rhsdat)) == '[(i64:0x0=0)]'  # Ins.__repr__
                     s_noinit = (k := ysvr.dic.get(insx >> 8)) and k.initv == []
                     if n_noinit or s_noinit:
                         curline.append(f'{deflet}[{lhsstr}]')
@@ -189,56 +234,252 @@ def do_ystb(yenv: YEnv, scr_idx: int, ystb: YSTB, f: TextIO):
                         curline.append(f'{deflet}[{lhsstr}={rhsstr}]')
             case '_':
                 assert narg == 1
-                assert isinstance(dat := args[0].dat, list)
-                curline.append(f'_[{yenv.dat_to_argstr(dat)}]')
+                curline.append(f'_[{yenv.arg_to_argstr(args[0])}]')
             case _:
                 arg_segs: list[str] = []
                 for arg in args:
                     arg_name = arg_names[arg.id]
                     assert len(arg_name) > 0
-                    assert isinstance(dat := arg.dat, list)
-                    arg_segs.append(f'{arg_name}{arg.aop_str}{yenv.dat_to_argstr(dat)}')
+                    arg_segs.append(f'{arg_name}{arg.aop_str}{yenv.arg_to_argstr(arg)}')
                 curline.append(f'{cmd_name}[{' '.join(arg_segs)}]')
     assert len(lbls) == 0, 'lables not consumed: '+str(lbls)
-    f.write('\n'.join(';'.join(l) for l in lines))  # no newline after
+    if prevline is not None:
+        emit(prevline)
+    emit(curline)
+
+
+def decompile_scr(yenv: YEnv, kcc: KnownCmdCode, scr_idx: int, isrc: str | Buf, opath: str,
+                  ystb_key: int, i_encoding: str, o_encoding: str, mem: MemTrace | None = None,
+                  pcache: PCache | None = None):
+    # -> ybn size, cmds, exprs rendered, parse secs, emit secs, locals defined
+    # mem: ystb and emit spans; with a budget the script is parsed into YSTBC
+    # pcache: the script comes from there as YSTBC, parsed and put there on a miss
+    t0 = perf_counter()
+    cls = YSTBC if mem and mem.budget is not None else YSTB
+    with mem_span(mem, 'ystb', opath):
+        if pcache:
+            if isinstance(isrc, str):
+                with open(isrc, 'rb') as fp:
+                    isrc = fp.read()
+            ystb = pcache.ystbc(isrc, kcc, ystb_key, encoding=i_encoding)
+            nbytes = len(isrc)
+        elif isinstance(isrc, str):  # path of the ybn, or the ybn itself
+            with open(isrc, 'rb') as fp:
+                ystb = cls(fp, kcc, ystb_key, encoding=i_encoding)
+                nbytes = fp.tell()
+        else:
+            ystb = cls(isrc, kcc, ystb_key, encoding=i_encoding)
+            nbytes = len(isrc)
+    t1 = perf_counter()
+    n0 = (rc := yenv.rcache).hits+rc.misses  # one lookup per expr
+    d0 = len(yenv.defd)
+    makedirs(path.dirname(opath), exist_ok=True)
+    with mem_span(mem, 'emit', opath), open(opath, 'w', encoding=o_encoding, newline='\r\n') as ft:
+        do_ystb(yenv, scr_idx, ystb, ft)
+    return nbytes, len(ystb.cmds), rc.hits+rc.misses-n0, t1-t0, perf_counter()-t1, yenv.defd[d0:]
+
+
+# decompile(jobs=N): every worker process has its own YEnv, so locals defined
+# by ins_def_local stay in that worker (local names only depend on the index);
+# a local defined by two scripts is caught in the parent, from what each returns
+_wenv: tuple[YEnv, KnownCmdCode] | None = None
+_wpcache: PCache | None = None
+
+
+def _worker_init(yscd: YSCD | None, ysvr: YSVR, yslb: YSLB, yscm: YSCM, to_new_tostr: bool,
+                 pcache_dir: str | None = None):
+    global _wenv, _wpcache
+    _wenv = YEnv(yscd, ysvr, yslb, yscm, to_new_tostr=to_new_tostr), yscm.kcc
+    _wpcache = PCache(pcache_dir) if pcache_dir else None
+
+
+def _worker_scr(args: tuple[int, str | Buf, str, int, str, str]):
+    assert _wenv
+    return decompile_scr(*_wenv, *args, None, _wpcache)
+
+
+CacheVer = 1  # bump whenever do_ystb output may change
+
+
+class DCache:  # decompiled scripts by content, see decompile(cache_dir=)
+    __slots__ = ['root']
+    root: str
+
+    def __init__(self, root: str, env: bytes):
+        # any change to the env (ysv/ysl/ysc/YSCom, key, encodings...) drops everything
+        fp = sha256(env).hexdigest()
+        self.root = root
+        try:
+            with open(env_path := path.join(root, 'env'), 'r') as f:
+                old = f.read()
+        except FileNotFoundError:
+            old = None
+        if old != fp:
+            rmtree(path.join(root, 'scr'), ignore_errors=True)
+            makedirs(root, exist_ok=True)
+            with open(env_path, 'w') as f:
+                f.write(fp)
+
+    @staticmethod
+    def key(scr_idx: int, ystb: bytes):  # labels are looked up by scr_idx
+        return sha256(scr_idx.to_bytes(4, LE)+ystb).hexdigest()
+
+    def file(self, key: str):
+        return path.join(self.root, 'scr', key[:2], key)
+
+    def has(self, key: str):
+        return path.isfile(self.file(key))
+
+    def get(self, key: str, opath: str):
+        copyfile(self.file(key), opath)
+
+    def put(self, key: str, opath: str):
+        makedirs(path.dirname(p := self.file(key)), exist_ok=True)
+        copyfile(opath, tmp := f'{p}.{os.getpid()}.tmp')
+        os.replace(tmp, p)
 
 
 def decompile(idir: str, odir: str, yscd: YSCD | None, ystb_key: int, *,
               i_encoding: str = CP932, o_encoding: str = CP932,
-              to_new_tostr: bool = False, yscm: YSCM | None = None):
-    with open(path.join(idir, 'ysv.ybn'), 'rb') as fp:
-        ysvr = YSVR(Rdr(fp.read(), enc=i_encoding))
-    with open(path.join(idir, 'ysl.ybn'), 'rb') as fp:
-        yslb = YSLB(Rdr(fp.read(), enc=i_encoding))
-    if not yscm:
-        with open(path.join(idir, 'ysc.ybn'), 'rb') as fp:
-            yscm = YSCM(Rdr(fp.read(), enc=i_encoding))
-    with open(path.join(idir, 'yst_list.ybn'), 'rb') as fp:
-        ystl = YSTL(Rdr(fp.read(), enc=i_encoding))
-    yenv = YEnv(yscd, ysvr, yslb, yscm, to_new_tostr=to_new_tostr)
+              to_new_tostr: bool = False, yscm: YSCM | None = None, jobs: int = 1,
+              cache_dir: str | None = None, log: TextIO | None | EllipsisType = ...,
+              observer: Observer | None = None, mem: MemTrace | None = None,
+              pcache_dir: str | None = None, part: tuple[int, int] = (0, 1)):
+    def read(name: str):
+        with open(path.join(idir, name), 'rb') as fp:
+            return fp.read()
+    _decompile(read, lambda name: path.join(idir, name), odir, yscd, ystb_key,
+               i_encoding=i_encoding, o_encoding=o_encoding, to_new_tostr=to_new_tostr, yscm=yscm,
+               jobs=jobs, cache_dir=cache_dir, log=log, observer=observer, mem=mem,
+               pcache_dir=pcache_dir, part=part)
+
+
+def decompile_mem(files: YPF | Mapping[str, Buf], odir: str, yscd: YSCD | None, ystb_key: int, *,
+                  prefix: str = 'ysbin\\', i_encoding: str = CP932, o_encoding: str = CP932,
+                  to_new_tostr: bool = False, yscm: YSCM | None = None, jobs: int = 1,
+                  cache_dir: str | None = None, log: TextIO | None | EllipsisType = ...,
+                  observer: Observer | None = None, mem: MemTrace | None = None,
+                  pcache_dir: str | None = None, part: tuple[int, int] = (0, 1)):
+    # straight from an archive (or any name -> data), ysbin is never written out
+    def read(name: str):
+        return files[prefix+name]
+    _decompile(read, read, odir, yscd, ystb_key,
+               i_encoding=i_encoding, o_encoding=o_encoding, to_new_tostr=to_new_tostr, yscm=yscm,
+               jobs=jobs, cache_dir=cache_dir, log=log, observer=observer, mem=mem,
+               pcache_dir=pcache_dir, part=part)
+
+
+def _decompile(read: Callable[[str], Buf], isrc: Callable[[str], str | Buf],
+               odir: str, yscd: YSCD | None, ystb_key: int, *,
+               i_encoding: str = CP932, o_encoding: str = CP932,
+               to_new_tostr: bool = False, yscm: YSCM | None = None, jobs: int = 1,
+               cache_dir: str | None = None, log: TextIO | None | EllipsisType = ...,
+               observer: Observer | None = None, mem: MemTrace | None = None,
+               pcache_dir: str | None = None, part: tuple[int, int] = (0, 1)):
+    # read: ybn name -> data, isrc: ybn name -> what decompile_scr opens
+    # observer: stage (load, env), script_begin/script_end per script in order, decompile_end
+    # mem: load and env spans, ystb and emit per script; all in this process, so jobs=1
+    # pcache_dir: parsed ysv/ysl/ysc/yst_list and scripts are kept there (PCache)
+    # part: (k, n), only every n-th script from the k-th, so n calls (in any processes)
+    # share one game; part 0 also writes the empty scripts and globals
+    # log: None is quiet, ... is whatever sys.stdout is at call time (redirect_stdout works)
+    # a local defined by two scripts fails, with any jobs; scripts from the cache
+    # or in other parts aren't decompiled here, so they aren't checked against
+    out = sys.stdout if log is ... else log
+
+    def say(*a: Any):
+        _ = out and out.write(' '.join(map(str, a))+'\n')
+    frugal = mem and mem.budget is not None
+    jobs = 1 if mem else jobs
+    t = t0 = perf_counter()
+    pcache = PCache(pcache_dir) if pcache_dir else None
+
+    def parse(cls: type, data: Buf):
+        return pcache.parse(cls, data, i_encoding) if pcache else cls(MRdr(data, enc=i_encoding))
+    with mem_span(mem, 'load'):
+        ysvr = parse(YSVR, bysv := read('ysv.ybn'))
+        yslb = parse(YSLB, bysl := read('ysl.ybn'))
+        if not yscm:
+            yscm = parse(YSCM, read('ysc.ybn'))
+        ystl = parse(YSTL, read('yst_list.ybn'))
+    if observer:
+        observer('stage', name='load', bytes=len(bysv)+len(bysl), secs=(t := perf_counter())-t0)
+    with mem_span(mem, 'env'):
+        yenv = YEnv(yscd, ysvr, yslb, yscm, to_new_tostr=to_new_tostr,
+                    rcache_size=1 << 10 if frugal else 1 << 16)
+    _ = observer and observer('stage', name='env', secs=perf_counter()-t)
     glbs = yenv.global_yst
-    for scr in ystl.scrs:
-        out_path = path.join(odir, scr.path.replace('\\', '/'))
-        makedirs(path.dirname(out_path), exist_ok=True)
-        if scr.nvar < 0:
-            with open(out_path, 'w', encoding=o_encoding, newline='\r\n') as ft:
-                if glbs and not 'macro' in out_path.lower():
-                    print(scr.idx, out_path, '- empty, we put globals here')
-                    ft.writelines(glbs)
-                    glbs = None
-                else:
-                    print(scr.idx, out_path, '- empty')
-                    ft.write(';')
-        else:
-            print(scr.idx, out_path)
-            with open(path.join(idir, f'yst{scr.idx:0>5}.ybn'), 'rb') as fp:
-                ystb = YSTB(fp, yscm.kcc, ystb_key, encoding=i_encoding)
-            with open(out_path, 'w', encoding=o_encoding, newline='\r\n') as ft:
-                do_ystb(yenv, scr.idx, ystb, ft)
-    if glbs:
-        print('no empty file to put global, writing to outdir/global.yst')
+    cache = None
+    if cache_dir:
+        env = (CacheVer, yscd, yscm, ystb_key, i_encoding, o_encoding, to_new_tostr)
+        cache = DCache(cache_dir, bytes(bysv)+bytes(bysl)+pickle.dumps(env))
+    keys: dict[int, str] = {}  # scr_idx -> cache key
+    hits: set[int] = set()
+    tasks: list[tuple[int, str, str, int, str, str]] = []  # ybn name, not yet isrc
+    k, n = part
+    mine = {s.idx for s in [s for s in ystl.scrs if s.nvar >= 0][k::n]}
+    scrs = [s for s in ystl.scrs if s.idx in mine or s.nvar < 0 and k == 0]
+    for scr in scrs:
+        if scr.nvar >= 0:
+            out_path = path.join(odir, scr.path.replace('\\', '/'))
+            name = f'yst{scr.idx:0>5}.ybn'
+            if cache:
+                keys[scr.idx] = key = cache.key(scr.idx, bytes(read(name)))
+                if cache.has(key):
+                    hits.add(scr.idx)
+                    continue
+            tasks.append((scr.idx, name, out_path, ystb_key, i_encoding, o_encoding))
+    args = ((i, isrc(name), *rest) for i, name, *rest in tasks)
+    if jobs > 1:
+        pool = ProcessPoolExecutor(jobs, initializer=_worker_init,
+                                   initargs=(yscd, ysvr, yslb, yscm, to_new_tostr, pcache_dir))
+        done = pool.map(_worker_scr, args, chunksize=4)
+    else:
+        pool = None
+        done = (decompile_scr(yenv, yscm.kcc, *a, mem, pcache) for a in args)
+    defd: dict[int, int] = {}  # local idx -> scr_idx that defined it
+    try:
+        for scr in scrs:  # results come back in order, so does the log
+            out_path = path.join(odir, scr.path.replace('\\', '/'))
+            makedirs(path.dirname(out_path), exist_ok=True)
+            _ = observer and observer('script_begin', idx=scr.idx, path=out_path)
+            st = None
+            if scr.nvar < 0:
+                with open(out_path, 'w', encoding=o_encoding, newline='\r\n') as ft:
+                    if glbs and not 'macro' in out_path.lower():
+                        say(scr.idx, out_path, '- empty, we put globals here')
+                        ft.writelines(glbs)
+                        glbs = None
+                        kind = 'globals'
+                    else:
+                        say(scr.idx, out_path, '- empty')
+                        ft.write(';')
+                        kind = 'empty'
+            elif cache and scr.idx in hits:
+                say(scr.idx, out_path, '- cached')
+                cache.get(keys[scr.idx], out_path)
+                kind = 'cached'
+            else:
+                say(scr.idx, out_path)
+                st = next(done)
+                for i in st[5]:
+                    assert (d := defd.setdefault(i, scr.idx)) == scr.idx, \
+                        f'already defined: local {i} in scripts {d} and {scr.idx}'
+                _ = cache and cache.put(keys[scr.idx], out_path)
+                kind = 'decompiled'
+            if observer:
+                nb, nc, ne, tp, te, _ = st or (0, 0, 0, 0.0, 0.0, ())
+                observer('script_end', idx=scr.idx, path=out_path, kind=kind, cache_hit=kind == 'cached',
+                         bytes=nb, cmds=nc, exprs=ne, parse=tp, emit=te)
+    finally:
+        _ = pool and pool.shutdown(cancel_futures=True)
+    if glbs and k == 0:
+        say('no empty file to put global, writing to outdir/global.yst')
         with open(path.join(odir, 'global.yst'), 'w',
                   encoding=o_encoding, newline='\r\n') as ft:
             ft.writelines(glbs)
-    if not yscd:
-        print('working without YSCom.ycd, you need to rename _comXXX yourself')
+    if not yscd and k == 0:
+        say('working without YSCom.ycd, you need to rename _comXXX yourself')
+    if observer:
+        observer('decompile_end', scripts=len(scrs), decompiled=len(tasks), cached=len(hits),
+                 jobs=jobs, secs=perf_counter()-t0)
@@ -1,22 +1,285 @@
 #!/bin/env python3
 from __future__ import annotations
+import os
 import json
-from sys import stdout
-from os import makedirs, path
-from struct import Struct as St
+import pickle
+import tracemalloc
+from array import array
+from sys import stdout, byteorder
+from time import perf_counter
+from mmap import mmap, ACCESS_READ
+from os import makedirs, path, remove
+from struct import Struct as St, error as StructError
+from hashlib import sha256
 from murmurhash2 import murmurhash2 as _mmh2
-from collections import defaultdict as defdict
-from typing import Callable, BinaryIO, TextIO, Literal, Any
-from zlib import crc32 as _crc32, adler32 as _adl32, decompress
+from collections import defaultdict as defdict, OrderedDict, deque
+from threading import Lock
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, BinaryIO, TextIO, Literal, Any, Iterable, Iterator, Mapping, Sequence
+from zlib import crc32 as _crc32, adler32 as _adl32, compress, decompress, decompressobj
+_copy_file_range = getattr(os, 'copy_file_range', None)  # linux
+_sendfile = getattr(os, 'sendfile', None)  # unix
 Vmi, Vma = 200, 501  # supports Vmi=..<Vma
 def goodver(v: int): return Vmi <= v < Vma
 def nohash(b: bytes, e: int): return False
 def crc32(b: bytes, e: int): return a if (a := _crc32(b)) != e else False
-def mmh2(b: bytes, e: int): return a if (a := _mmh2(b, 0)) != e else False
+# murmurhash2 takes bytes only: a view or bytearray is copied whole to hash it
+def mmh2(b: bytes, e: int): return a if (a := _mmh2(bytes(b), 0)) != e else False
 def adler32(b: bytes, e: int): return a if (a := _adl32(b)) != e else False
 def magic(b: bytes): return int.from_bytes(b, 'little')
 
 
+def pmap(func: Callable[[Any], Any], items: Iterable[Any], jobs: int) -> Iterator[Any]:
+    # in order; at most 2*jobs items submitted ahead of the consumer (Executor.map
+    # would take in all of items at once, and hold all results not yet consumed)
+    if jobs <= 1:
+        yield from map(func, items)
+        return
+    with ThreadPoolExecutor(jobs) as ex:
+        q: deque[Any] = deque()
+        for item in items:
+            q.append(ex.submit(func, item))
+            if len(q) >= 2*jobs:
+                yield q.popleft().result()
+        while q:
+            yield q.popleft().result()
+
+
+def kcopy(src: int, dst: int, off: int, n: int):
+    # copy n bytes at off of fd src to the position of fd dst, inside the kernel
+    # returns how many were copied, the caller writes the rest itself
+    done = 0
+    if _copy_file_range:
+        try:
+            while done < n and (k := _copy_file_range(src, dst, n-done, off+done)):
+                done += k
+        except OSError:  # e.g. EXDEV on old kernels
+            pass
+    if _sendfile:
+        try:
+            while done < n and (k := _sendfile(dst, src, off+done, n-done)):
+                done += k
+        except OSError:  # e.g. non-socket dst on macos
+            pass
+    return done
+
+
+class LRU:  # bounded mapping, least recently used goes first
+    __slots__ = ['size', 'dic', 'hits', 'misses']
+    size: int
+    dic: OrderedDict[Any, Any]
+    hits: int
+    misses: int
+
+    def __init__(self, size: int):
+        self.size = size
+        self.dic = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key: Any) -> Any:
+        try:
+            val = self.dic[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.dic.move_to_end(key)
+        self.hits += 1
+        return val
+
+    def put(self, key: Any, val: Any):
+        self.dic[key] = val
+        if len(self.dic) > self.size:
+            self.dic.popitem(last=False)
+
+    def resize(self, size: int):
+        self.size = size
+        while len(self.dic) > size:
+            self.dic.popitem(last=False)
+
+    def stats(self):
+        n = self.hits+self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.dic),
+                'hit_rate': self.hits/n if n else 0.0}
+
+
+# observers get obs(event, **fields) from extract() and decompile(); fields are
+# json-able, call sites skip building them when no observer is given
+Observer = Callable[..., None]
+
+
+class JsonLines:  # observer writing one json object per event
+    __slots__ = ['f', 't0', 'lock']
+    f: TextIO
+    t0: float
+    lock: Lock
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.t0 = perf_counter()
+        self.lock = Lock()
+
+    def __call__(self, ev: str, **fields: Any):
+        line = json.dumps({'ev': ev, 't': round(perf_counter()-self.t0, 6), **fields}, ensure_ascii=False)
+        with self.lock:
+            self.f.write(line+'\n')
+
+
+class Summary:  # observer counting events and summing their numeric fields
+    __slots__ = ['count', 'sums', 'lock']
+    count: defdict[str, int]
+    sums: defdict[str, defdict[str, int | float]]
+    lock: Lock
+
+    def __init__(self):
+        self.count = defdict(int)
+        self.sums = defdict(lambda: defdict(int))
+        self.lock = Lock()
+
+    def __call__(self, ev: str, **fields: Any):
+        if ev == 'stage':  # one line per stage
+            ev = 'stage:'+fields['name']
+        with self.lock:
+            self.count[ev] += 1
+            sums = self.sums[ev]
+            for k, v in fields.items():
+                if k not in ('idx', 'jobs') and isinstance(v, (int, float)):  # bools: how often true
+                    sums[k] += v
+
+    def report(self) -> dict[str, dict[str, int | float]]:
+        return {ev: {'count': n, **self.sums[ev]} for ev, n in self.count.items()}
+
+    def print(self, f: TextIO = stdout):
+        for ev, r in self.report().items():
+            f.write(ev+': '+', '.join(f'{k}={round(v, 3)}' for k, v in r.items())+'\n')
+
+
+def tee(*obs: Observer | None) -> Observer | None:  # all of them, None if none
+    if len(lst := [o for o in obs if o]) < 2:
+        return lst[0] if lst else None
+
+    def each(ev: str, **fields: Any):
+        for o in lst:
+            o(ev, **fields)
+    return each
+
+
+class MemTrace:  # peak memory per span (a stage, member or script), through tracemalloc
+    # spans nest: an outer span's peak includes its inner ones
+    # with a budget, going over it anywhere raises MemoryError with a report,
+    # and YPF / extract / decompile given this take their frugal paths; InsCache
+    # is shrunk to MemInsCache entries until close
+    # use as `with MemTrace(...) as mem:`, close stops tracemalloc if we started it
+    # what is counted is what tracemalloc sees: allocations through Python's
+    # allocators (objects, bytes, zlib state); not mmap pages, the page cache,
+    # or C code that mallocs on its own, so the budget is for the Python heap
+    # if tracemalloc is already on, its session is left as is (no reset_peak):
+    # a span's peak is then the session's only if it rose while the span was open,
+    # else the memory in use at its ends
+    __slots__ = ['budget', 'observer', 'items', 'stack', 'own', 'ins_size', 'seen']
+    budget: int | None  # bytes
+    observer: Observer | None  # gets a mem event per span
+    items: list[tuple[str, str, int, int]]  # kind, name, peak, retained
+    stack: list[list[Any]]  # [kind, name, base, peak so far]
+    own: bool  # tracemalloc was started by us
+    ins_size: int | None  # InsCache size to restore
+    seen: int  # session peak last looked at, when not own
+
+    def __init__(self, budget: int | None = None, observer: Observer | None = None):
+        self.budget = budget
+        self.observer = observer
+        self.items = []
+        self.stack = []
+        self.ins_size = None
+        if budget is not None and InsCache.size > MemInsCache:
+            self.ins_size = InsCache.size
+            InsCache.resize(MemInsCache)
+        if (own := not tracemalloc.is_tracing()):
+            tracemalloc.start()
+        self.own = own
+        self.seen = tracemalloc.get_traced_memory()[1]
+
+    def close(self):
+        if self.own:
+            tracemalloc.stop()
+            self.own = False
+        if self.ins_size is not None:
+            InsCache.resize(self.ins_size)
+            self.ins_size = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_: Any):
+        self.close()
+
+    @contextmanager
+    def span(self, kind: str, name: str = ''):  # ended even if the block raises
+        self.begin(kind, name)
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.end(ok)
+
+    def traced(self):  # -> in use, peak since the last call
+        cur, peak = tracemalloc.get_traced_memory()
+        if self.own:
+            tracemalloc.reset_peak()
+            return cur, peak
+        peak, self.seen = peak if peak > self.seen else cur, peak
+        return cur, peak
+
+    def begin(self, kind: str, name: str = ''):
+        cur, peak = self.traced()
+        if self.stack:
+            top = self.stack[-1]
+            top[3] = max(top[3], peak)
+        self.stack.append([kind, name, cur, cur])
+        self.check(cur)
+
+    def end(self, check: bool = True):  # check=False: unwinding, don't raise over it
+        cur, peak = self.traced()
+        kind, name, base, pk = self.stack.pop()
+        pk = max(pk, peak)
+        if self.stack:
+            top = self.stack[-1]
+            top[3] = max(top[3], pk)
+        self.items.append(item := (kind, name, pk-base, cur-base))
+        _ = self.observer and self.observer('mem', kind=kind, name=name, peak=item[2], retained=item[3])
+        _ = check and self.check(pk)
+
+    def check(self, used: int):
+        if self.budget is not None and used > self.budget:
+            where = ' > '.join(f'{k}:{n}' if n else k for k, n, *_ in self.stack)
+            raise MemoryError(f'memory budget {self.budget} exceeded: {used} in use at {where or "top"}\n'
+                              + self.text())
+
+    def need(self, n: int, what: str):  # about to hold n bytes at once
+        if self.budget is not None and (cur := tracemalloc.get_traced_memory()[0])+n > self.budget:
+            raise MemoryError(f'memory budget {self.budget} too small for {what}: '
+                              f'{n} more bytes with {cur} in use\n'+self.text())
+
+    def report(self) -> dict[str, dict[str, Any]]:  # kind -> count, max peak and where, retained
+        rep: dict[str, dict[str, Any]] = {}
+        for kind, name, peak, kept in self.items:
+            r = rep.setdefault(kind, {'count': 0, 'peak': -1, 'at': '', 'retained': 0})
+            r['count'] += 1
+            r['retained'] += kept
+            if peak > r['peak']:
+                r['peak'], r['at'] = peak, name
+        return rep
+
+    def text(self):
+        return ''.join(f'{k}: {r["count"]} spans, peak {r["peak"]/1e6:.2f} MB at {r["at"] or "-"}, '
+                       f'retained {r["retained"]/1e6:.2f} MB\n' for k, r in self.report().items())
+
+
+def mem_span(mem: MemTrace | None, kind: str, name: str = ''):
+    return mem.span(kind, name) if mem else nullcontext()
+
+
 def swap_trans(*args: tuple[int, int]):
     bs = bytearray(range(256))
     for i, j in args:
@@ -26,11 +289,11 @@ def swap_trans(*args: tuple[int, int]):
     return bs
 
 
-def decode(b: bytes, e: str):
+def decode(b: bytes | bytearray | memoryview, e: str):
     try:
-        return b.decode(e)
+        return str(b, e)
     except UnicodeDecodeError as x:
-        x.add_note(f'bytes={b}')
+        x.add_note(f'bytes={bytes(b)}')
         raise
 
 
@@ -49,6 +312,10 @@ HashPair = tuple[HashFunc, HashFunc]
 V470Hash: HashPair = (mmh2, mmh2)      # 464=..<Vma
 V265Hash: HashPair = (crc32, adler32)  # 265=..<464
 NoneHash: HashPair = (nohash, nohash)  # Vmi=..<265
+HashInc: dict[HashFunc, tuple[Callable[[bytes, int], int], int]] = {
+    crc32: (_crc32, 0), adler32: (_adl32, 1)}  # (update, initial)
+HashRaw: dict[HashFunc, Callable[[Buf], int]] = {  # the hash itself, for writing
+    nohash: lambda b: 0, crc32: _crc32, adler32: _adl32, mmh2: lambda b: _mmh2(bytes(b), 0)}
 NLSwaps = ((6, 53), (9, 11), (12, 16), (13, 19), (21, 27), (28, 30), (32, 35), (38, 41), (44, 47))
 NLTransV000 = swap_trans((3, 72), (17, 25), (46, 50), *NLSwaps)  # Vmi=..<500
 NLTransV500 = swap_trans((3, 10), (17, 24), (20, 46), *NLSwaps)  # 500
@@ -63,10 +330,127 @@ def fYpfEntV000(f: BinaryIO) -> Ints: return SYpfEntV000.unpack(f.read(18))
 def fYpfEntV470(f: BinaryIO) -> Ints: return SYpfEntV470.unpack(f.read(22))
 
 
+YpfManVer = 1
+
+
+def file_stat(p: str) -> list[int]:
+    try:
+        st = os.stat(p)
+    except FileNotFoundError:
+        return []
+    return [st.st_size, st.st_mtime_ns]
+
+
+def read_manifest(p: str) -> dict[str, list[int]]:
+    # name -> [offset, stored size, stored hash, file size, file mtime_ns]
+    try:
+        with open(p, 'r', encoding='utf-8') as f:
+            man = json.load(f)
+    except (FileNotFoundError, ValueError):  # first run or broken, extract all
+        return {}
+    return man['files'] if man.get('ver') == YpfManVer else {}
+
+
+def write_manifest(p: str, files: dict[str, list[int]]):
+    with open(tmp := p+'.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'ver': YpfManVer, 'files': files}, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, p)
+
+
+def ypf_tables(v: int, name_size_trans: bytes | None = None, name_byte_trans: bytes | None = None,
+               hash_name_file: HashPair | None = None) -> tuple[bytes, bytes, HashPair]:
+    # the ones not given, as version v uses them
+    if name_size_trans == None:
+        name_size_trans = NLTransV500 if v == 500 else NLTransV000
+    if name_byte_trans == None:
+        match v:
+            case 290: name_byte_trans = NameXorV290
+            case 500: name_byte_trans = NameXorV500
+            case _: name_byte_trans = NameXorV000
+    if hash_name_file == None:
+        match v:  # 200-264, 265-466, 470-500
+            case v if Vmi <= v < 265: hash_name_file = NoneHash
+            case v if 265 <= v < 470: hash_name_file = V265Hash
+            case v if 470 <= v < Vma: hash_name_file = V470Hash
+            case _: assert False
+    return name_size_trans, name_byte_trans, hash_name_file
+
+
+YpfIdxVer = 1
+YpfIdxMagic = magic(b'YPIX')
+SYpfIdxHead = St('<3I')  # magic, YpfIdxVer, nent
+SYpfIdxKey = St('<QQ32s32s')  # archive size, mtime_ns, header, options; then names size, names, table
+
+
+def ypf_index_key(f: BinaryIO, head: bytes, opts: tuple[Any, ...]) -> bytes | None:
+    # what an index must match: the archive's size, mtime and header, and the options
+    # names were decoded with; None if f isn't a file
+    try:
+        st = os.fstat(f.fileno())
+    except (AttributeError, OSError, ValueError):  # BytesIO, ...
+        return None
+    return SYpfIdxKey.pack(st.st_size, st.st_mtime_ns, head, sha256(pickle.dumps(opts)).digest())
+
+
+def read_ypf_index(p: str, key: bytes) -> list[YpfEnt] | None:
+    # None if missing, stale or broken: parse the table and write it again
+    try:
+        with open(p, 'rb') as f:
+            magi, ver, nent = SYpfIdxHead.unpack(f.read(SYpfIdxHead.size))
+            if magi != YpfIdxMagic or ver != YpfIdxVer or f.read(len(key)) != key:
+                return None
+            lnames, = SUInt[8].unpack(f.read(8))
+            names = f.read(lnames).decode('utf-8').split('\0') if nent else []
+            table = f.read(nent*SYpfEntV470.size)
+    except (FileNotFoundError, StructError, UnicodeDecodeError):
+        return None
+    if len(names) != nent or len(table) != nent*SYpfEntV470.size:
+        return None
+    return list(map(YpfEnt, names, SYpfEntV470.iter_unpack(table)))
+
+
+def write_ypf_index(p: str, key: bytes, ents: list[YpfEnt]):
+    names = '\0'.join(e.name for e in ents).encode('utf-8')
+    tmp = f'{p}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(SYpfIdxHead.pack(YpfIdxMagic, YpfIdxVer, len(ents))+key+SUInt[8].pack(len(names)))
+            f.write(names)
+            f.write(b''.join(SYpfEntV470.pack(e.kind, e.comp, e.ul, e.cl, e.off, e.hash) for e in ents))
+        os.replace(tmp, p)
+    except OSError:  # e.g. a read-only dir or a full disk, the index is only a shortcut
+        try:
+            remove(tmp)
+        except OSError:
+            pass
+
+
+class YpfEnt:
+    __slots__ = ['name', 'kind', 'comp', 'ul', 'cl', 'off', 'hash']
+    name: str
+    kind: int
+    comp: int  # 0:stored 1:zlib
+    ul: int  # uncompressed size
+    cl: int  # compressed (stored) size
+    off: int
+    hash: int  # of the stored bytes
+
+    def __init__(self, name: str, ent: Ints):
+        self.name = name
+        self.kind, self.comp, self.ul, self.cl, self.off, self.hash = ent
+
+
 class YPF:
-    __slots__ = ['ver', 'files']
+    __slots__ = ['ver', 'files', 'ents', 'dic', 'f', 'lock', 'mm', 'hash_file', 'mem']
     ver: int
-    files: list[tuple[str, bytes]]
+    files: list[tuple[str, bytes]] | None  # None if lazy
+    ents: list[YpfEnt]
+    dic: dict[str, int]  # name -> index in ents
+    f: BinaryIO  # lazy members are read from it, keep it open
+    lock: Lock
+    mm: mmap | Literal[False] | None  # of f, made on first use; False if f can't be mapped
+    hash_file: HashFunc
+    mem: MemTrace | None
 
     def __init__(
         self, f: BinaryIO, *,
@@ -74,66 +458,355 @@ class YPF:
         name_size_trans: bytes | None = None,
         name_byte_trans: bytes | None = None,
         hash_name_file: HashPair | None = None,
+        lazy: bool = False,
+        jobs: int = 1,
+        mem: MemTrace | None = None,
+        index: str | None = None,
     ):
-        m, v, nent, lhdr = U32x4.unpack(f.read(16))
-        assert m == YpfMagic
-        assert goodver(v)
-        assert not any(f.read(16))
-        if name_size_trans == None:
-            name_size_trans = NLTransV500 if v == 500 else NLTransV000
-        if name_byte_trans == None:
-            match v:
-                case 290: name_byte_trans = NameXorV290
-                case 500: name_byte_trans = NameXorV500
-                case _: name_byte_trans = NameXorV000
-        if hash_name_file == None:
-            match v:  # 200-264, 265-466, 470-500
-                case v if Vmi <= v < 265: hash_name_file = NoneHash
-                case v if 265 <= v < 470: hash_name_file = V265Hash
-                case v if 470 <= v < Vma: hash_name_file = V470Hash
-                case _: assert False
-        hash_name, hash_file = hash_name_file
-        f_ent = fYpfEntV470 if v >= 470 else fYpfEntV000
-        lhdir = lhdr if v >= 300 else (lhdr+32)  # size of header+entries
-        entns: list[tuple[str, Ints]] = []
-        for _ in range(nent):
-            name_hash, name_size = fYpfEntName(f)
-            name_byte = f.read(name_size_trans[name_size ^ 0xff])
-            name_byte = name_byte.translate(name_byte_trans)
-            assert (a := hash_name(name_byte, name_hash)) == False, \
-                f'name_hash: expect={name_hash:0>8x}, actual={a:0>8x}, bytes={name_byte}'
-            entns.append((decode(name_byte, name_encoding), f_ent(f)))
-        assert (a := f.tell()) == lhdir, f'head_size: expect={lhdir}, actual={a}'
-        files: list[tuple[str, bytes]] = []
-        for name, (_kind, comp, ul, cl, offset, hash) in entns:
-            _, data = f.seek(offset), f.read(cl)
-            assert (a := len(data)) == cl, \
-                f'read_file: expect={cl}, actual={a}, filename={name}'
-            assert (a := hash_file(data, hash)) == False, \
-                f'file_hash: expect={hash:0>8x}, actual={a:0>8x}, filename={name}'
-            if comp:
-                assert (a := len(data := decompress(data))) == ul, \
-                    f'decompress: expect={ul}, actual={a}, filename={name}'
-            files.append((name, data))
-        self.ver = v
-        self.files = files
-
-    def extract(self, dst_dir: str, log: TextIO | None = stdout):
-        for opath, data in self.files:
-            _ = log and log.write(opath+'\n')
-            opath = path.join(dst_dir, opath.replace('\\', '/'))
+        # mem: spans for the entry table and each member loaded, on one thread;
+        # with a budget members are only loaded on demand (lazy)
+        # index: sidecar file of the decoded entry table; used when it matches the
+        # archive (size, mtime, header) and the options, else written after parsing
+        if mem:
+            lazy, jobs = lazy or mem.budget is not None, 1
+        with mem_span(mem, 'ypf', 'entries'):
+            m, v, nent, lhdr = U32x4.unpack((head := f.read(32))[:16])
+            assert m == YpfMagic
+            assert goodver(v)
+            assert not any(head[16:])
+            name_size_trans, name_byte_trans, (hash_name, hash_file) = \
+                ypf_tables(v, name_size_trans, name_byte_trans, hash_name_file)
+            # hashes are keyed by name, so only the builtin ones (a lambda's name says nothing)
+            ikey = index and hash_name in HashRaw and hash_file in HashRaw and ypf_index_key(
+                f, head, (name_encoding, bytes(name_size_trans), bytes(name_byte_trans),
+                          hash_name.__name__, hash_file.__name__)) or None
+            if (ents := ikey and read_ypf_index(index, ikey)) is None:  # type: ignore
+                f_ent = fYpfEntV470 if v >= 470 else fYpfEntV000
+                lhdir = lhdr if v >= 300 else (lhdr+32)  # size of header+entries
+                ents = []
+                for _ in range(nent):
+                    name_hash, name_size = fYpfEntName(f)
+                    name_byte = f.read(name_size_trans[name_size ^ 0xff])
+                    name_byte = name_byte.translate(name_byte_trans)
+                    assert (a := hash_name(name_byte, name_hash)) == False, \
+                        f'name_hash: expect={name_hash:0>8x}, actual={a:0>8x}, bytes={name_byte}'
+                    ents.append(YpfEnt(decode(name_byte, name_encoding), f_ent(f)))
+                assert (a := f.tell()) == lhdir, f'head_size: expect={lhdir}, actual={a}'
+                _ = ikey and write_ypf_index(index, ikey, ents)  # type: ignore
+            assert len(ents) == nent
+            self.ver = v
+            self.ents = ents
+            self.dic = {e.name: i for i, e in enumerate(ents)}
+            self.f = f
+            self.lock = Lock()
+            self.mm = None
+            self.hash_file = hash_file
+            self.mem = mem
+        self.files = None if lazy else [(e.name, d) for e, d in zip(ents, pmap(self.read, ents, jobs))]
+
+    def read(self, e: YpfEnt):
+        if (mem := self.mem):
+            mem.need(e.cl+e.ul, e.name)
+            with mem.span('member', e.name):
+                return self.load(e, self.read_raw(e))
+        return self.load(e, self.read_raw(e))
+
+    def read_raw(self, e: YpfEnt):  # stored bytes, unverified
+        with self.lock:  # f is shared by extract workers
+            _, data = self.f.seek(e.off), self.f.read(e.cl)
+        assert (a := len(data)) == e.cl, \
+            f'read_file: expect={e.cl}, actual={a}, filename={e.name}'
+        return data
+
+    def read_chunks(self, e: YpfEnt, chunk: int):  # stored bytes, unverified
+        for i in range(0, e.cl, chunk):
+            n = min(chunk, e.cl-i)
+            with self.lock:
+                _, data = self.f.seek(e.off+i), self.f.read(n)
+            assert (a := len(data)) == n, \
+                f'read_file: expect={e.cl}, actual={i+a}, filename={e.name}'
+            yield data
+
+    def view(self, e: YpfEnt):  # stored bytes without copying, None if f can't be mapped
+        if self.mm is None:
+            with self.lock:
+                try:
+                    self.mm = self.mm or mmap(self.f.fileno(), 0, access=ACCESS_READ)
+                except (AttributeError, OSError, ValueError):  # BytesIO, pipe, ...
+                    self.mm = False
+        if not self.mm:
+            return None
+        view = memoryview(self.mm)[e.off:e.off+e.cl]
+        assert (a := len(view)) == e.cl, \
+            f'read_file: expect={e.cl}, actual={a}, filename={e.name}'
+        return view
+
+    def copy_stored(self, e: YpfEnt, fo: BinaryIO):
+        # comp == 0: verify over the mapping, then let the kernel copy fd to fd
+        # V470+ (mmh2) is not verified in place: murmurhash2 takes bytes only, so the
+        # member is copied once to hash it; only the copy to fo is saved there
+        assert not e.comp
+        if (view := self.view(e)) is None:
+            return False
+        with view:  # released, so close() can unmap
+            if self.hash_file is mmh2:
+                _ = self.mem and self.mem.need(e.cl, e.name)
+                self.verify(e, bytes(view))
+            else:
+                self.verify(e, view)
+            fo.flush()
+            if (n := kcopy(self.f.fileno(), fo.fileno(), e.off, e.cl)) < e.cl:
+                fo.write(view[n:])
+        return True
+
+    def close(self):  # unmaps; f itself is the caller's to close
+        if self.mm:
+            self.mm.close()
+        self.mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_: Any):
+        self.close()
+
+    def verify(self, e: YpfEnt, data: bytes | memoryview):
+        assert (a := self.hash_file(data, e.hash)) == False, \
+            f'file_hash: expect={e.hash:0>8x}, actual={a:0>8x}, filename={e.name}'
+
+    def load(self, e: YpfEnt, data: bytes):  # verify and decompress stored bytes
+        self.verify(e, data)
+        if e.comp:
+            assert (a := len(data := decompress(data))) == e.ul, \
+                f'decompress: expect={e.ul}, actual={a}, filename={e.name}'
+        return data
+
+    def stream(self, e: YpfEnt, fo: BinaryIO, chunk: int = 1 << 20):
+        # write a member to fo, holding about `chunk` bytes of it at a time
+        # except mmh2 (V470+): it can't be updated and takes bytes only, so a first
+        # pass holds the whole member once to verify it, then it is streamed in chunks;
+        # memory there is bounded by the member size, not by chunk
+        upd, h = HashInc.get(self.hash_file) or (None, 0)
+        if not upd and self.hash_file is not nohash:
+            _ = self.mem and self.mem.need(e.cl, e.name)
+            self.verify(e, self.read_raw(e))
+        parts = self.read_chunks(e, chunk)
+        d = decompressobj() if e.comp else None
+        ul = 0
+        for part in parts:
+            if upd:
+                h = upd(part, h)
+            if not d:
+                ul += fo.write(part)
+                continue
+            while part:
+                ul += fo.write(d.decompress(part, chunk))
+                part = d.unconsumed_tail
+        if upd:
+            assert h == e.hash, \
+                f'file_hash: expect={e.hash:0>8x}, actual={h:0>8x}, filename={e.name}'
+        if d:
+            ul += fo.write(d.flush())
+            assert d.eof and ul == e.ul, \
+                f'decompress: expect={e.ul}, actual={ul}, filename={e.name}'
+
+    def keys(self):
+        return self.dic.keys()
+
+    def __len__(self):
+        return len(self.ents)
+
+    def __contains__(self, name: str):
+        return name in self.dic
+
+    def __getitem__(self, name: str) -> bytes:
+        i = self.dic[name]
+        return self.read(self.ents[i]) if self.files is None else self.files[i][1]
+
+    def __iter__(self):  # names, as a Mapping does
+        return iter(self.dic)
+
+    def items(self):  # (name, data), lazy members are loaded one at a time
+        if self.files is not None:
+            yield from self.files
+        else:
+            for e in self.ents:
+                yield e.name, self.read(e)
+
+    def extract(self, dst_dir: str, log: TextIO | None = stdout, *,
+                jobs: int = 1, chunk: int = 1 << 20, incremental: bool = False,
+                observer: Observer | None = None, members: Sequence[int] | None = None):
+        # members are verified, decompressed and written on `jobs` threads
+        # (zlib and crc32 release the GIL); the log stays in archive order
+        # lazy members: stored ones are copied by the kernel where possible,
+        # compressed ones larger than `chunk` are streamed to disk
+        # incremental: skip members whose entry and output file are unchanged
+        # since the last run, as recorded in dst_dir.manifest.json
+        # observer: extract_begin, member (one per entry, in order), extract_end
+        # self.mem: an extract span per member, on one thread; with a budget
+        # everything bigger than a fraction of it is streamed
+        # members: only these entry indices, e.g. range(k, len(ents), n) for part k of n
+        assert not (incremental and members is not None), 'incremental: all members only'
+        if members is None:
+            members = range(len(self.ents))
+        man_path = path.normpath(dst_dir)+'.manifest.json'
+        old = read_manifest(man_path) if incremental else {}
+        if (mem := self.mem):
+            jobs = 1
+            if mem.budget is not None:
+                chunk = max(min(chunk, mem.budget//8), 1 << 12)
+
+        def work(i: int):
+            t = perf_counter() if observer else 0
+            e = self.ents[i]
+            opath = path.join(dst_dir, e.name.replace('\\', '/'))
+            ent = [e.off, e.cl, e.hash]
+            if (rec := old.get(e.name)) and rec == ent+file_stat(opath):
+                return e, 0, False, rec, True, 0
             makedirs(path.dirname(opath), exist_ok=True)
-            with open(opath, 'wb') as f:
-                f.write(data)
+            kern = False
+            with mem_span(mem, 'extract', e.name), open(opath, 'wb') as f:
+                try:
+                    if self.files is not None:
+                        size = f.write(self.files[i][1])
+                    elif not e.comp and (kern := self.copy_stored(e, f)):
+                        size = e.cl
+                    elif max(e.cl, e.ul) > chunk:
+                        self.stream(e, f, chunk)
+                        size = e.ul if e.comp else e.cl
+                    else:
+                        size = f.write(self.read(e))
+                except BaseException:
+                    f.close()
+                    remove(opath)
+                    raise
+            return e, size, kern, ent+file_stat(opath), False, observer and perf_counter()-t
+        t = perf_counter()
+        new: dict[str, list[int]] = {}
+        nfile = nkern = nskip = size = 0
+        _ = observer and observer('extract_begin', dir=dst_dir, files=len(members), jobs=jobs)
+        try:
+            for e, n, kern, rec, skip, secs in pmap(work, members, jobs):
+                new[e.name] = rec
+                if observer:
+                    observer('member', name=e.name, bytes=n, stored=0 if skip else e.cl,
+                             kernel=kern, unchanged=skip, secs=secs)
+                if skip:
+                    nskip += 1
+                    continue
+                _ = log and log.write(e.name+'\n')
+                nfile += 1
+                nkern += kern
+                size += n
+        finally:  # members done so far stay valid even if one failed
+            if incremental:
+                write_manifest(man_path, new)
+        t = perf_counter()-t
+        if observer:
+            observer('extract_end', files=nfile, kernel=nkern, unchanged=nskip, bytes=size, secs=t)
+        _ = log and log.write(f'extracted {nfile} files ({nkern} kernel copies, {nskip} unchanged), '
+                              f'{size/1e6:.2f} MB in {t:.2f}s, {size/1e6/(t or 1e-9):.1f} MB/s\n')
+
+
+def untrans(t: bytes):  # inverse of a translate table
+    return bytes(t.index(i) for i in range(256))
+
+
+def write_ypf(f: BinaryIO, names: list[str], srcs: Iterable[Buf | YPF], ver: int, *,
+              name_encoding: str = CP932,
+              name_size_trans: bytes | None = None,
+              name_byte_trans: bytes | None = None,
+              hash_name_file: HashPair | None = None,
+              comp: Callable[[str, Buf], bool] | None = None,
+              kind: Callable[[str], int] | None = None,
+              level: int = -1,
+              jobs: int = 1) -> list[YpfEnt]:
+    # a YPF that YPF(f, **same options) reads back, f at its start; -> the entries
+    # srcs, one per name: new data, or an archive holding a member of that name, whose
+    # stored bytes are copied as they are (by the kernel where possible), hash too
+    # when both use the same hash; only new data is compressed, on `jobs` threads
+    # comp: compress new data or store it, default compress all; kind: default 0
+    size_trans, byte_trans, (hash_name, hash_file) = \
+        ypf_tables(ver, name_size_trans, name_byte_trans, hash_name_file)
+    size_untrans, byte_untrans = untrans(size_trans), untrans(byte_trans)
+    raw_name, raw_file = HashRaw[hash_name], HashRaw[hash_file]
+    ent_st = SYpfEntV470 if ver >= 470 else SYpfEntV000
+    nbs = [n.encode(name_encoding) for n in names]
+    lhdir = 32+sum(SYpfEntName.size+len(nb)+ent_st.size for nb in nbs)
+    f.write(bytes(lhdir))  # the table goes here once sizes are known
+
+    def prep(item: tuple[str, Buf | YPF]):  # -> kind, comp, ul, stored bytes or None, hash, source
+        name, src = item
+        if isinstance(src, YPF):
+            e = src.ents[src.dic[name]]
+            h = e.hash if src.hash_file is hash_file else raw_file(src.read_raw(e))
+            return e.kind, e.comp, e.ul, None, h, (src, e)
+        c = comp(name, src) if comp else True
+        data = compress(src, level) if c else src
+        return kind(name) if kind else 0, int(c), len(src), data, raw_file(data), None
+    ents: list[YpfEnt] = []
+    off = lhdir
+    for name, (k, c, ul, data, h, copy) in zip(names, pmap(prep, zip(names, srcs, strict=True), jobs)):
+        cl = copy[1].cl if copy else len(data)
+        assert ver >= 470 or off+cl < 1 << 32, f'u32 offsets before V470: {name}'
+        if copy:
+            src, e = copy
+            if (view := src.view(e)) is None:
+                f.write(src.read_raw(e))
+            else:
+                with view:
+                    if _fileno(f) is not None:
+                        f.flush()
+                        if (n := kcopy(src.f.fileno(), f.fileno(), e.off, e.cl)) < e.cl:
+                            f.write(view[n:])
+                    else:
+                        f.write(view)
+        else:
+            f.write(data)
+        ents.append(YpfEnt(name, (k, c, ul, cl, off, h)))
+        off += cl
+    table = bytearray()
+    for nb, e in zip(nbs, ents):
+        table += SYpfEntName.pack(raw_name(nb), size_untrans[len(nb)] ^ 0xff)
+        table += nb.translate(byte_untrans)
+        table += ent_st.pack(e.kind, e.comp, e.ul, e.cl, e.off, e.hash)
+    f.seek(0)
+    f.write(U32x4.pack(YpfMagic, ver, len(nbs), lhdir if ver >= 300 else lhdir-32))
+    f.write(bytes(16)+table)
+    f.seek(0, 2)
+    return ents
+
+
+def _fileno(f: BinaryIO):
+    try:
+        return f.fileno()
+    except (AttributeError, OSError, ValueError):  # BytesIO, ...
+        return None
+
 
+def repack(src: YPF, f: BinaryIO, new: Mapping[str, Buf], *, ver: int | None = None, **kwargs: Any):
+    # src with members replaced or added from new; unchanged ones are copied as stored,
+    # replaced ones keep their kind and compression; kwargs as write_ypf, default the
+    # tables of ver, default src.ver
+    names = list(src.keys())+[n for n in new if n not in src]
+    kw: dict[str, Any] = {
+        'comp': lambda n, _: bool(src.ents[src.dic[n]].comp) if n in src else True,
+        'kind': lambda n: src.ents[src.dic[n]].kind if n in src else 0, **kwargs}
+    return write_ypf(f, names, (new.get(n, src) for n in names), src.ver if ver is None else ver, **kw)
 
-class Rdr:
+
+SUInt = {1: St('<B'), 2: St('<H'), 4: St('<I'), 8: St('<Q')}
+SSInt = {1: St('<b'), 2: St('<h'), 4: St('<i'), 8: St('<q')}
+Buf = bytes | bytearray | memoryview
+
+
+class Rdr:  # numbers are decoded in place, only read() slices
     __slots__ = ['idx', 'enc', 'buf']
     idx: int
     enc: str
-    buf: bytes
+    buf: Buf
 
-    def __init__(self, data: bytes, enc: str = CP932):
+    def __init__(self, data: Buf, enc: str = CP932):
         self.idx = 0
         self.enc = enc
         self.buf = data
@@ -146,15 +819,22 @@ class Rdr:
         self.idx = end
         return ret
 
+    def blob(self, n: int):  # read() that is safe to keep
+        return bytes(self.read(n))
+
     def byte(self):
         b = self.buf[self.idx]
         self.idx += 1
         return b
 
-    def ui(self, n: int):
+    def ui(self, n: int) -> int:
+        if (t := SUInt.get(n)):
+            return self.unpack(t)[0]
         return int.from_bytes(self.read(n), LE, signed=False)
 
-    def si(self, n: int):
+    def si(self, n: int) -> int:
+        if (t := SSInt.get(n)):
+            return self.unpack(t)[0]
         return int.from_bytes(self.read(n), LE, signed=True)
 
     def bz(self):
@@ -170,10 +850,14 @@ class Rdr:
         return decode(self.read(n), enc or self.enc)
 
     def unpack(self, t: St) -> Ints:
-        return t.unpack(self.read(t.size))
+        beg = self.idx
+        end = beg+t.size
+        assert end <= (l := len(self.buf)), f'read: want={t.size}, got={l-beg}, at={beg}'
+        self.idx = end
+        return t.unpack_from(self.buf, beg)
 
     def f64(self) -> float:
-        return F64.unpack(self.read(8))[0]
+        return self.unpack(F64)[0]
 
     def assert_eof(self, ver: int):
         i = self.idx
@@ -181,6 +865,21 @@ class Rdr:
         assert i == l, f'incomplete read, idx={i}, len={l}, ver={ver}'
 
 
+class MRdr(Rdr):  # over a memoryview: read() doesn't copy, strings decode from the view
+    __slots__ = ['raw']
+    raw: bytes | bytearray  # what buf views, for bz()
+
+    def __init__(self, data: bytes | bytearray, enc: str = CP932):
+        super().__init__(memoryview(data), enc)
+        self.raw = data
+
+    def bz(self):
+        beg = self.idx
+        end = self.raw.index(0, beg)
+        self.idx = end+1
+        return self.buf[beg:end]
+
+
 NErrStr = 37
 SYscHead = U32x4
 YscMagic = magic(b'YSCM')
@@ -240,7 +939,7 @@ class YSCM:
         self.ver = ver
         self.cmds = [MCmd(r) for _ in range(ncmd)]
         self.errs = [r.sz() for _ in range(NErrStr)]
-        self.b256 = r.read(256)
+        self.b256 = r.blob(256)
         self.kcc = KnownCmdCode(self)
         r.assert_eof(ver)
 
@@ -568,8 +1267,8 @@ class YSCD:
         self.estr = [r.sz() for _ in range(NErrStr)]
         blok, pad4 = r.unpack(U32x2)
         assert pad4 == 0
-        self.blok = [r.read(blok) for _ in range(blok)]
-        self.b800 = r.read(0x800)
+        self.blok = [r.blob(blok) for _ in range(blok)]
+        self.b800 = r.blob(0x800)
         r.assert_eof(ver)
 
     def print(self, f:  TextIO = stdout):
@@ -605,30 +1304,78 @@ SArgR290 = St('<HBBI')
 YtbMagic = int.from_bytes(b'YSTB', LE)
 
 
+class XorCodec:  # xor is its own inverse: trans() both encrypts and decrypts
+    __slots__ = ['key', 'mask']
+    key: int
+    mask: int  # the key repeated over XorChunk bytes, as one wide integer
+
+    def __init__(self, key: int):
+        self.key = key
+        self.mask = int.from_bytes(key.to_bytes(4, 'big')*(XorChunk//4), LE)
+
+    def trans(self, bs: bytes | bytearray | memoryview) -> bytearray:
+        # XorChunk bytes at a time as one wide integer, in place if bs is a bytearray;
+        # the mask stays XorChunk long however big a section is
+        if not isinstance(bs, bytearray):
+            bs = bytearray(bs)
+        if (n := len(bs)) == 0 or not self.key:  # key 0: already plain
+            return bs
+        mask, c = self.mask, XorChunk
+        for o in range(0, n-c+1, c):
+            bs[o:o+c] = (int.from_bytes(bs[o:o+c], LE) ^ mask).to_bytes(c, LE)
+        if (r := n % c):  # the tail, with as many mask bytes
+            bs[n-r:] = (int.from_bytes(bs[n-r:], LE) ^ mask & ((1 << 8*r)-1)).to_bytes(r, LE)
+        return bs
+
+    encrypt = decrypt = trans
+
+
+XorChunk = 1 << 16  # bytes per wide xor, a multiple of 4
+_xor_codecs: dict[int, XorCodec] = {}
+
+
 def xor_trans(bs: bytearray, key: int):
-    o = len(bs) & ~3
-    b0, b1, b2, b3 = k = key.to_bytes(4, 'big')
-    for i in range(0, o, 4):
-        bs[i+0] ^= b0
-        bs[i+1] ^= b1
-        bs[i+2] ^= b2
-        bs[i+3] ^= b3
-    for j in range(len(bs) & 3):
-        bs[o+j] ^= k[j]
-    return bs
+    if not (c := _xor_codecs.get(key)):
+        c = _xor_codecs[key] = XorCodec(key)
+    return c.trans(bs)
 
 
 AssignOp = ['=', '+=', '-=',  '*=',  '/=',  '%=',  '&=',  '|=',  '^=']
 
 
 class Arg:
-    __slots__ = ['id', 'typ', 'aop', 'len', 'off', 'dat']
+    __slots__ = ['id', 'typ', 'aop', 'len', 'off', '_dat', '_exp', '_raw', '_enc']
     id: int
     typ: int  # 7-3:TODO:meaning? 21:type; TODO:meaning for vardef cmds?
     aop: int  # assignment op
     len: int
     off: int
-    dat: None | str | list[Ins]
+    _dat: None | str | tuple[Ins, ...] | Literal[False]  # False: not yet decoded
+    _exp: Buf | None  # expr data this arg points into, until raw is taken from it
+    _raw: bytes | None  # just this arg's bytes, the key for InsCache and YEnv.rcache
+    _enc: str
+
+    @property
+    def dat(self) -> None | str | tuple[Ins, ...]:
+        # a tuple, shared through InsCache by every arg with the same bytes
+        if (dat := self._dat) is False:
+            assert (raw := self.raw) is not None
+            dat = self._dat = Ins.parse_cached(raw, self._enc)
+        return dat
+
+    @dat.setter
+    def dat(self, dat: None | str | Sequence[Ins]):
+        self._dat = tuple(dat) if isinstance(dat, list) else dat  # never a list shared with the caller
+        self._exp = self._raw = None
+
+    @property
+    def raw(self) -> bytes | None:  # expr bytes, None if dat isn't from expr data
+        # copied out of _exp once, the first time, and _exp is dropped: an arg
+        # never pins the whole expr section
+        if (raw := self._raw) is None and (exp := self._exp) is not None:
+            raw = self._raw = bytes(exp[self.off:self.off+self.len])
+            self._exp = None
+        return raw
 
     @property
     def aop_str(self):
@@ -638,26 +1385,26 @@ class Arg:
         if self.dat is None:
             return f'id={self.id} typ={self.typ:0>2x} aop={self.aop}({self.aop_str}) len={self.len} off={self.off}'
         else:
-            return f'id={self.id} typ={self.typ:0>2x} aop={self.aop}({self.aop_str}): {self.dat}'
+            dat = list(d) if isinstance(d := self.dat, tuple) else d  # printed as before
+            return f'id={self.id} typ={self.typ:0>2x} aop={self.aop}({self.aop_str}): {dat}'
 
     @classmethod
-    def initV0(cls, r: Rdr, dat: None | bytes = None):
+    def initV0(cls, r: Rdr, dat: None | Buf = None):
         a = cls()
         a.id, a.typ, a.aop, siz, off = r.unpack(SArg)
         a.len = siz
         a.off = off
         assert a.aop <= 8
-        if dat == None:
-            a.dat = None
-        else:
-            dat = dat[off:off+siz]
-            assert len(dat) == siz
-            # print(*map(hex, dat))
-            a.dat = Ins.parse_buf(dat, r.enc)
+        a.dat = None
+        if dat is not None:  # decoded on first access of a.dat
+            assert off+siz <= len(dat)
+            a._dat = False
+            a._exp = dat
+            a._enc = r.enc
         return a
 
     @classmethod
-    def initWORD(cls, r: Rdr, dat: bytes):
+    def initWORD(cls, r: Rdr, dat: Buf):
         a = cls()
         a.id, a.typ, a.aop, siz, off = r.unpack(SArg)
         a.len = siz
@@ -696,7 +1443,7 @@ class Cmd:
     npar: int  # V300: for gosub, return: parameter count (PINT, PSTR)
 
     @classmethod
-    def initV2xx(cls, r: Rdr, dat: bytes, kcc: KnownCmdCode):
+    def initV2xx(cls, r: Rdr, dat: Buf, kcc: KnownCmdCode):
         c = cls()
         c.off = r.idx
         c.npar = 0
@@ -709,7 +1456,7 @@ class Cmd:
         return c
 
     @classmethod
-    def initV290(cls, r: Rdr, dat: bytes, kcc: KnownCmdCode):
+    def initV290(cls, r: Rdr, dat: Buf, kcc: KnownCmdCode):
         c = cls()
         c.off = r.idx
         c.npar = 0
@@ -722,7 +1469,7 @@ class Cmd:
         return c
 
     @classmethod
-    def initV300(cls, r: Rdr, rArg: Rdr, rLno: Rdr, dat: bytes, kcc: KnownCmdCode):
+    def initV300(cls, r: Rdr, rArg: Rdr, rLno: Rdr, dat: Buf, kcc: KnownCmdCode):
         c = cls()
         c.off = r.idx
         c.lno = rLno.ui(4)
@@ -734,7 +1481,7 @@ class Cmd:
         c.args = [Arg.initV0(rArg, None)]
         return c
 
-    def _initArgs(self, r: Rdr, narg: int, dat: bytes, kcc: KnownCmdCode):
+    def _initArgs(self, r: Rdr, narg: int, dat: Buf, kcc: KnownCmdCode):
         match self.code:
             case kcc.IF | kcc.ELSE if narg == 3:
                 assert narg == 3
@@ -752,6 +1499,36 @@ class Cmd:
         return self
 
 
+def ystb_sections(f: BinaryIO | Buf, key: int):
+    # -> ver, cmds, args, expr, lnos; decrypted, args and lnos are empty before V300
+    # f is a file or the whole ybn in memory
+    src = memoryview(f) if isinstance(f, Buf) else None
+    magi, ver, *rest = SYtbHead.unpack(f.read(32) if src is None else src[:32])
+    assert magi == YtbMagic
+    assert Vmi <= ver < Vma
+    if ver < 300:
+        lcmd, lexp, exp_off, *pads = rest
+        assert not any(pads)
+        assert 32+lcmd == exp_off
+        larg = llno = 0
+    else:
+        ncmd, lcmd, larg, lexp, llno, pad = rest
+        assert ncmd * 4 == lcmd == llno
+        assert larg % 12 == 0
+        assert pad == 0
+    secs: list[bytearray] = []
+    o = 32
+    for n in (lcmd, larg, lexp, llno):
+        if src is None:  # cpython/issues/133492
+            assert f.readinto(sec := bytearray(n)) == n  # type: ignore
+        else:
+            assert len(sec := bytearray(src[o:o+n])) == n
+        secs.append(xor_trans(sec, key))
+        o += n
+    assert len(f.read(1)) == 0 if src is None else len(src) == o
+    return ver, *secs
+
+
 class YSTB:
     __slots__ = ['ver', 'cmds', 'key', 'kcc']
     ver: int
@@ -759,44 +1536,27 @@ class YSTB:
     key: int
     kcc: KnownCmdCode
 
-    def __init__(self, f: BinaryIO, kcc: KnownCmdCode,  key: int, *, encoding: str = CP932):
-        magi, ver, *rest = SYtbHead.unpack(f.read(32))
-        assert magi == YtbMagic
-        assert Vmi <= ver < Vma
+    def __init__(self, f: BinaryIO | Buf, kcc: KnownCmdCode,  key: int, *, encoding: str = CP932):
+        ver, dcmd, darg, dexp, dlno = ystb_sections(f, key)
+        dexp = memoryview(dexp)  # args parse views of it
         if ver < 300:
-            lcmd, lexp, exp_off, *pads = rest
-            assert not any(pads)
-            assert 32+lcmd == exp_off  # cpython/issues/133492
-            assert f.readinto(dcmd := bytearray(lcmd)) == lcmd  # type: ignore
-            assert f.readinto(dexp := bytearray(lexp)) == lexp  # type: ignore
-            rcmd = Rdr(xor_trans(dcmd, key), encoding)
-            dexp = xor_trans(dexp, key)
+            rcmd = MRdr(dcmd, encoding)
             func = Cmd.initV290 if ver == 290 else Cmd.initV2xx
             cmds: list[Cmd] = []
-            while rcmd.idx < lcmd:
+            while rcmd.idx < len(dcmd):
                 cmds.append(func(rcmd, dexp, kcc))
             self.cmds = cmds
         else:
-            ncmd, lcmd, larg, lexp, llno, pad = rest
-            assert ncmd * 4 == lcmd == llno
-            assert larg % 12 == 0
-            assert pad == 0  # cpython/issues/133492
-            assert f.readinto(dcmd := bytearray(lcmd)) == lcmd  # type: ignore
-            assert f.readinto(darg := bytearray(larg)) == larg  # type: ignore
-            assert f.readinto(dexp := bytearray(lexp)) == lexp  # type: ignore
-            assert f.readinto(dlno := bytearray(llno)) == llno  # type: ignore
-            rcmd = Rdr(xor_trans(dcmd, key), encoding)
-            rarg = Rdr(xor_trans(darg, key), encoding)
-            rlno = Rdr(xor_trans(dlno, key), encoding)
-            dexp = xor_trans(dexp, key)
-            self.cmds = [Cmd.initV300(rcmd, rarg, rlno, dexp, kcc) for _ in range(ncmd)]
+            rcmd = MRdr(dcmd, encoding)
+            rarg = MRdr(darg, encoding)
+            rlno = MRdr(dlno, encoding)
+            self.cmds = [Cmd.initV300(rcmd, rarg, rlno, dexp, kcc) for _ in range(len(dcmd)//4)]
             rcmd.assert_eof(ver)
             rarg.assert_eof(ver)
             rlno.assert_eof(ver)
         self.ver = ver
         self.key = key
         self.kcc = kcc
-        assert len(f.read(1)) == 0
 
     def print(self, f: TextIO, cmds: list[DCmd] | list[MCmd]):
         kcc = self.kcc
@@ -828,6 +1588,271 @@ class YSTB:
                 f.write(f'- [{j}] {aname}{repr(arg)}\n')
 
 
+class YSTBC:  # YSTB as struct-of-arrays, cmds are Cmd-like views into it
+    __slots__ = ['ver', 'key', 'kcc', 'enc', 'exp',
+                 'c_off', 'c_lno', 'c_code', 'c_npar', 'c_arg',
+                 'a_id', 'a_typ', 'a_aop', 'a_len', 'a_off', 'a_kind']
+    ver: int
+    key: int
+    kcc: KnownCmdCode
+    enc: str
+    exp: bytes  # decrypted expr data
+    c_off: array[int]  # I
+    c_lno: array[int]  # I
+    c_code: array[int]  # B
+    c_npar: array[int]  # H
+    c_arg: array[int]  # I, args of cmd i are [c_arg[i], c_arg[i+1])
+    a_id: array[int]  # H
+    a_typ: array[int]  # B
+    a_aop: array[int]  # B
+    a_len: array[int]  # I
+    a_off: array[int]  # I
+    a_kind: array[int]  # B, ArgNone ArgExpr ArgWord
+
+    def __init__(self, f: BinaryIO | Buf, kcc: KnownCmdCode,  key: int, *, encoding: str = CP932):
+        ver, dcmd, darg, dexp, dlno = ystb_sections(f, key)
+        self.ver, self.key, self.kcc, self.enc, self.exp = ver, key, kcc, encoding, bytes(dexp)
+        self.c_off, self.c_lno, self.c_code = array('I'), array('I'), array('B')
+        self.c_npar, self.c_arg = array('H'), array('I', [0])
+        self.a_id, self.a_typ, self.a_aop = array('H'), array('B'), array('B')
+        self.a_len, self.a_off, self.a_kind = array('I'), array('I'), array('B')
+        if ver < 300:
+            i, lcmd = 0, len(dcmd)
+            ret_arg = SArgR290 if ver == 290 else SArgR2xx
+            while i < lcmd:
+                code, narg, lno = SCmdV200.unpack_from(dcmd, i)
+                self._cmd(i, lno, code, 0, narg)
+                i += SCmdV200.size
+                if code == kcc.RETURNCODE:
+                    assert narg == 1
+                    id, typ, aop, *siz = ret_arg.unpack_from(dcmd, i)
+                    self._arg(id, typ, aop, siz[0] if siz else 0, 0, ArgNone)
+                    i += ret_arg.size
+                    continue
+                for k, arg in enumerate(SArg.iter_unpack(dcmd[i:i+narg*SArg.size])):
+                    self._arg(*arg, self._kind(code, narg, k))
+                i += narg*SArg.size
+            assert i == lcmd
+        else:
+            args = SArg.iter_unpack(darg)
+            lnos = SUInt[4].iter_unpack(dlno)
+            for i, (code, narg, npar) in enumerate(SCmdV300.iter_unpack(dcmd)):
+                self._cmd(i*4, next(lnos)[0], code, npar, narg)
+                assert code != kcc.RETURNCODE or narg == 1
+                for k in range(narg):
+                    kind = ArgNone if code == kcc.RETURNCODE else self._kind(code, narg, k)
+                    self._arg(*next(args), kind)
+            assert len(self.a_id)*SArg.size == len(darg)
+
+    def _cmd(self, off: int, lno: int, code: int, npar: int, narg: int):
+        self.c_off.append(off)
+        self.c_lno.append(lno)
+        self.c_code.append(code)
+        self.c_npar.append(npar)
+        self.c_arg.append(self.c_arg[-1]+narg)
+
+    def _kind(self, code: int, narg: int, k: int):  # same cases as Cmd._initArgs
+        kcc = self.kcc
+        match code:
+            case kcc.IF | kcc.ELSE if narg == 3: return ArgExpr if k == 0 else ArgNone
+            case kcc.LOOP:
+                assert narg == 2
+                return ArgExpr if k == 0 else ArgNone
+            case kcc.ELSE: assert False, f'ELSE narg={narg}'
+            case kcc.WORD:
+                assert narg == 1
+                return ArgWord
+            case _: return ArgExpr
+
+    def _arg(self, id: int, typ: int, aop: int, siz: int, off: int, kind: int):
+        assert aop <= 8
+        if kind == ArgWord:
+            assert id == typ == aop == 0
+        if kind != ArgNone:
+            assert off+siz <= len(self.exp)
+        self.a_id.append(id)
+        self.a_typ.append(typ)
+        self.a_aop.append(aop)
+        self.a_len.append(siz)
+        self.a_off.append(off)
+        self.a_kind.append(kind)
+
+    @property
+    def cmds(self):
+        return CmdsView(self)
+
+    def nbytes(self):  # size of the arrays and expr data; after load the arrays are views
+        # (getsizeof would count only the view objects), so count their items either way
+        return sum(len(a)*a.itemsize for a in map(self.__getattribute__, YtbcArrs)) + len(self.exp)
+
+    def dump(self, f: BinaryIO):  # for load(), arrays in native byte order
+        arrs = [getattr(self, k) for k in YtbcArrs]
+        f.write(SYtbcHead.pack(YtbcMagic, self.ver, self.key, *(len(a)*a.itemsize for a in arrs), len(self.exp)))
+        for a in arrs:
+            f.write(a)
+            f.write(bytes(-len(a)*a.itemsize % 8))  # keep every array aligned
+        f.write(self.exp)
+
+    @classmethod
+    def load(cls, buf: Buf, kcc: KnownCmdCode, *, encoding: str = CP932):
+        # arrays are views of buf (an mmap of a dumped file needs no copy), read-only
+        m = memoryview(buf)
+        magi, ver, key, *lens, lexp = SYtbcHead.unpack_from(m)
+        assert magi == YtbcMagic
+        y = cls.__new__(cls)
+        y.ver, y.key, y.kcc, y.enc = ver, key, kcc, encoding
+        o = SYtbcHead.size
+        for (k, code), n in zip(YtbcArrs.items(), lens):
+            setattr(y, k, m[o:o+n].cast(code))
+            o += n+(-n % 8)
+        assert len(m) == o+lexp
+        y.exp = bytes(m[o:])
+        return y
+
+    print = YSTB.print
+
+
+YtbcMagic = magic(b'YTBC')
+YtbcArrs = {'c_off': 'I', 'c_lno': 'I', 'c_code': 'B', 'c_npar': 'H', 'c_arg': 'I',
+            'a_id': 'H', 'a_typ': 'B', 'a_aop': 'B', 'a_len': 'I', 'a_off': 'I', 'a_kind': 'B'}
+SYtbcHead = St(f'<3I4x{len(YtbcArrs)+1}Q')  # magic, ver, key, pad, array sizes, expr size; 112 bytes
+ArgNone, ArgExpr, ArgWord = 0, 1, 2
+
+
+class ArgView:
+    __slots__ = ['y', 'j']
+    y: YSTBC
+    j: int
+
+    def __init__(self, y: YSTBC, j: int):
+        self.y = y
+        self.j = j
+
+    id = property(lambda self: self.y.a_id[self.j])
+    typ = property(lambda self: self.y.a_typ[self.j])
+    aop = property(lambda self: self.y.a_aop[self.j])
+    len = property(lambda self: self.y.a_len[self.j])
+    off = property(lambda self: self.y.a_off[self.j])
+    aop_str = property(lambda self: AssignOp[self.y.a_aop[self.j]])
+    __repr__ = Arg.__repr__
+
+    @property
+    def dat(self) -> None | str | tuple[Ins, ...]:  # decoded on every access
+        y, j = self.y, self.j
+        if (kind := y.a_kind[j]) == ArgNone:
+            return None
+        off = y.a_off[j]
+        exp = memoryview(y.exp)[off:off+y.a_len[j]]
+        return decode(exp, y.enc) if kind == ArgWord else Ins.parse_cached(bytes(exp), y.enc)
+
+    @property
+    def raw(self) -> bytes | None:  # see Arg.raw
+        y, j = self.y, self.j
+        if y.a_kind[j] != ArgExpr:
+            return None
+        off = y.a_off[j]
+        return y.exp[off:off+y.a_len[j]]
+
+
+class CmdView:
+    __slots__ = ['y', 'i']
+    y: YSTBC
+    i: int
+
+    def __init__(self, y: YSTBC, i: int):
+        self.y = y
+        self.i = i
+
+    off = property(lambda self: self.y.c_off[self.i])
+    lno = property(lambda self: self.y.c_lno[self.i])
+    code = property(lambda self: self.y.c_code[self.i])
+    npar = property(lambda self: self.y.c_npar[self.i])
+
+    @property
+    def args(self):
+        y, i = self.y, self.i
+        return [ArgView(y, j) for j in range(y.c_arg[i], y.c_arg[i+1])]
+
+
+class CmdsView:
+    __slots__ = ['y']
+    y: YSTBC
+
+    def __init__(self, y: YSTBC):
+        self.y = y
+
+    def __len__(self):
+        return len(self.y.c_code)
+
+    def __getitem__(self, i: int):
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        return CmdView(self.y, i % len(self))
+
+    def __iter__(self):
+        y = self.y
+        return (CmdView(y, i) for i in range(len(y.c_code)))
+
+
+PCacheVer = 2  # bump whenever a parsed structure may change
+
+
+class PCache:  # parsed structures by content, on disk; see decompile(pcache_dir=)
+    # YSVR YSLB YSTL YSCD YSCM are pickled, YSTB is kept as YSTBC arrays and read
+    # back whole (its arrays view those bytes, no mapping is left open); a key
+    # covers the source bytes, everything that went into the parse and PCacheVer,
+    # so a changed input or library never hits an old entry
+    __slots__ = ['root', 'hits', 'misses']
+    root: str
+    hits: int
+    misses: int
+
+    def __init__(self, root: str):
+        self.root = root
+        self.hits = self.misses = 0
+
+    def file(self, what: Any, data: Buf):
+        h = sha256(pickle.dumps((PCacheVer, what)))
+        h.update(data)
+        key = h.hexdigest()
+        return path.join(self.root, key[:2], key)
+
+    def put(self, p: str, dump: Callable[[BinaryIO], Any]):
+        makedirs(path.dirname(p), exist_ok=True)
+        with open(tmp := f'{p}.{os.getpid()}.tmp', 'wb') as f:
+            dump(f)
+        os.replace(tmp, p)
+
+    def parse(self, cls: type, data: Buf, enc: str = CP932):  # cls(MRdr(data, enc))
+        p = self.file((cls.__name__, enc), data)
+        try:
+            with open(p, 'rb') as f:
+                obj = pickle.load(f)
+            self.hits += 1
+            return obj
+        except Exception:  # missing, truncated, foreign: whatever unpickling raises, parse again
+            pass
+        self.misses += 1
+        obj = cls(MRdr(data, enc))
+        self.put(p, lambda f: pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL))
+        return obj
+
+    def ystbc(self, data: Buf, kcc: KnownCmdCode, key: int, *, encoding: str = CP932):
+        codes = tuple(getattr(kcc, k) for k in kcc.__slots__)
+        p = self.file(('YSTBC', codes, key, encoding, byteorder), data)
+        try:
+            with open(p, 'rb') as f:
+                y = YSTBC.load(f.read(), kcc, encoding=encoding)
+            self.hits += 1
+            return y
+        except Exception:  # as in parse
+            pass
+        self.misses += 1
+        y = YSTBC(data, kcc, key, encoding=encoding)
+        self.put(p, y.dump)
+        return y
+
+
 SIns = St('<BH')
 InsList: dict[int, tuple[int, str]] = {
     0x2C: (0, 'nop'),  # between indices
@@ -933,7 +1958,7 @@ class Ins:
         return f'({self.op}:{a}f)'
 
     @classmethod
-    def parse_buf(cls, b: bytes, enc: str):
+    def parse_buf(cls, b: Buf, enc: str):
         l = len(b)
         r = Rdr(b, enc)
         e: list[Ins] = []
@@ -941,8 +1966,15 @@ class Ins:
             e.append(Ins(r))
         return e
 
+    @classmethod
+    def parse_cached(cls, b: bytes, enc: str) -> tuple[Ins, ...]:
+        # through InsCache: equal bytes share one tuple
+        if (e := InsCache.get(key := (b, enc))) is None:
+            InsCache.put(key, e := tuple(cls.parse_buf(b, enc)))
+        return e
+
     @staticmethod
-    def list_to_tree(lst: list[Ins],
+    def list_to_tree(lst: Sequence[Ins],
                      map_val: Callable[[int | str | float], str],
                      var_name: Callable[[int], str],
                      to_new_tostr: bool) -> InsTree:
@@ -1000,7 +2032,79 @@ class Ins:
         _tree_to_str_lst(tree, lst := [])
         return ''.join(lst)
 
+    @staticmethod
+    def render(lst: Sequence[Ins],
+               map_val: Callable[[int | str | float], str],
+               var_name: Callable[[int], str],
+               to_new_tostr: bool) -> tuple[str, str]:
+        # tree_to_str(list_to_tree(...)) in one pass without recursion
+        # -> (text, root op); root op is 'adr' for a unary &
+        stk: list[tuple[str, str] | None] = []  # (text, root op), None as idxbeg marker
+        for ins in lst:
+            arg = ins.arg
+            match (op := ins.op):
+                case 'nop': pass
+                case 'str' | 'f64' | 'i8' | 'i16' | 'i32' | 'i64':
+                    assert arg is not None
+                    stk.append((str(map_val(arg)), op))
+                case 'var':
+                    assert isinstance(arg, int)
+                    v = var_name(arg)
+                    if to_new_tostr and v.startswith('$@'):
+                        stk.append(('$('+v[1:]+')', '$'))
+                    else:
+                        stk.append((v, op))
+                case 'arr':
+                    assert isinstance(arg, int)
+                    stk.append((var_name(arg)+'()', op))
+                case 'idxbeg':
+                    assert isinstance(arg, int)
+                    stk.append((var_name(arg), 'idx'))
+                    stk.append(None)
+                case 'idxend':
+                    idxs: list[str] = []
+                    while (item := stk.pop()):
+                        idxs.append(item[0])
+                    assert len(idxs) > 0 and (idx := stk[-1]) and idx[1] == 'idx'
+                    v = idx[0]
+                    text = '('+','.join(reversed(idxs))+')'
+                    if to_new_tostr and v.startswith('$@'):
+                        stk[-1] = ('$('+v[1:]+text+')', '$')
+                    else:
+                        stk[-1] = (v+text, 'idx')
+                case '$' | '@':
+                    assert (item := stk.pop())
+                    stk.append((op+'('+item[0]+')', op))
+                case 'neg':
+                    assert (item := stk.pop())
+                    text = '-(' + item[0] + ')' if OpPrec['neg'] < OpPrec[item[1]] else '-' + item[0]
+                    stk.append((text, op))
+                case _:
+                    assert (rhs := stk.pop())
+                    rtext, rop = rhs
+                    if len(stk) == 0:  # unary, only at the top: the rest is ignored
+                        if op == '&':
+                            paren = OpPrec['adr'] < OpPrec[rop]
+                            return ('&('+rtext+')' if paren else '&'+rtext), 'adr'
+                        paren = OpPrec[op] < OpPrec[rop]
+                        return (op+'('+rtext+')' if paren else op+rtext), op
+                    assert (lhs := stk.pop())
+                    ltext, lop = lhs
+                    my_prec = OpPrec[op]
+                    if my_prec < OpPrec[lop]:
+                        ltext = '('+ltext+')'
+                    if my_prec <= OpPrec[rop]:
+                        rtext = '('+rtext+')'
+                    if op == '&':
+                        stk.append(('('+ltext+' & '+rtext+')', op))
+                    else:
+                        stk.append((ltext+op+rtext, op))
+        assert len(stk) == 1 and stk[0]
+        return stk[0]
+
 
+InsCache = LRU(1 << 16)  # (expr bytes, encoding) -> tuple[Ins, ...]
+MemInsCache = 1 << 10  # InsCache size under a MemTrace budget
 OpPrec: defdict[str, int] = defdict(lambda: -1, (
     ('adr', 1),
     ('neg', 2),
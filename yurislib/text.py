@@ -0,0 +1,300 @@
+# python -m yurislib.text ysbin [--key KEY_300] [--csv] [-o out]
+# python -m yurislib.text ysbin --patch edits.ndjson -o odir  (odir may be ysbin)
+# text for translation without decompiling: WORD text and the str literals in
+# command args, found by walking the raw sections; expressions are only scanned
+# for str instructions, never parsed into Ins or rendered
+import sys
+import csv
+import json
+from argparse import ArgumentParser
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain
+from json.encoder import encode_basestring
+from typing import Sequence
+from .fileformat import *
+from . import KEY_200, KEY_300
+
+TextKeys = ['script', 'path', 'cmd', 'line', 'kind', 'arg', 'n', 'text']
+TextRec = tuple[int, str, int, int, str, int, int, str]  # TextKeys; kind is word or str, n counts strs in an arg
+SHead = St('<BH')  # SIns, code and payload size
+SArgLen = St('<II')  # len, off of SArg
+TextEdit = tuple[int, int, int, str]  # cmd, arg, n, new text; as in TextRec
+
+
+def u32s(b: Buf):  # little endian u32 words
+    a = array('I', b)
+    _ = sys.byteorder == 'big' and a.byteswap()
+    return a
+
+
+class Cols:  # a YSTB as columns: per cmd and per arg arrays instead of a tuple each
+    __slots__ = ['codes', 'lnos', 'first', 'lens', 'offs', 'at']
+    codes: bytes  # cmd -> code
+    lnos: Sequence[int]  # cmd -> line
+    first: list[int]  # cmd -> its first arg, and the arg count at the end
+    lens: Sequence[int]  # arg -> SArg.len
+    offs: Sequence[int]  # arg -> SArg.off
+    at: Sequence[int]  # arg -> where its SArg is in its section (darg from V300, dcmd before)
+
+    def __init__(self, ver: int, dcmd: bytearray, darg: bytearray, dlno: bytearray, kcc: KnownCmdCode):
+        # RETURNCODE args before V300 are not SArg, they are left out (narg 0)
+        if ver >= 300:  # SCmdV300 is code, narg, _; the tables are plain u32 arrays
+            self.codes, nargs = bytes(dcmd[0::4]), bytes(dcmd[1::4])
+            self.lnos = u32s(dlno)
+            self.at = range(0, len(darg), SArg.size)
+            sargs = darg
+        else:  # args follow each cmd, so walk them
+            rcode, rsize = kcc.RETURNCODE, SArgR290.size if ver == 290 else SArgR2xx.size
+            codes, nargs, lnos, at, sargs = bytearray(), bytearray(), [], [], bytearray()
+            pc = 0
+            while pc < len(dcmd):
+                code, narg, lno = SCmdV200.unpack_from(dcmd, pc)
+                pc += SCmdV200.size
+                codes.append(code)
+                lnos.append(lno)
+                if code == rcode:
+                    nargs.append(0)
+                    pc += rsize*narg
+                else:
+                    nargs.append(narg)
+                    at.extend(range(pc, pc+SArg.size*narg, SArg.size))
+                    sargs += dcmd[pc:(pc := pc+SArg.size*narg)]
+            self.codes, self.lnos, self.at = bytes(codes), lnos, at
+        self.first = list(accumulate(nargs, initial=0))
+        words = u32s(sargs)
+        self.lens, self.offs = words[1::3], words[2::3]
+
+
+def ystb_text(f: BinaryIO | Buf, kcc: KnownCmdCode, key: int, scr_idx: int = 0,
+              scr_path: str = '', *, encoding: str = CP932) -> list[TextRec]:
+    ver, dcmd, darg, dexp, dlno = ystb_sections(f, key)
+    c = Cols(ver, dcmd, darg, dlno, kcc)
+    codes, lnos, first, lens, offs = c.codes, c.lnos, c.first, c.lens, c.offs
+    exp = bytes(dexp)
+    word, rcode = kcc.WORD, kcc.RETURNCODE
+    branch = (kcc.IF, kcc.ELSE, kcc.LOOP)  # only arg 0 is an expr, the rest are targets
+    ret: list[TextRec] = []
+    for i, code in enumerate(codes):
+        k, e = first[i], first[i+1]
+        if code == rcode or k == e:
+            continue
+        if code == word:
+            ret.append((scr_idx, scr_path, i, lnos[i], 'word', 0, 0,
+                        decode(exp[offs[k]:offs[k]+lens[k]], encoding)))
+            continue
+        if code in branch:
+            e = k+1
+        for j in range(e-k):
+            off, siz = offs[k+j], lens[k+j]
+            if exp.find(0x4D, off, off+siz) < 0:  # no str in it, the usual
+                continue
+            if exp[off] == 0x4D and siz == (exp[off+1] | exp[off+2] << 8)+3:  # just a str
+                ret.append((scr_idx, scr_path, i, lnos[i], 'str', j, 0,
+                            decode(exp[off+4:off+siz-1], encoding)))
+                continue
+            end, n = off+siz, 0
+            while off < end:
+                op, size = SHead.unpack_from(exp, off)
+                off += 3
+                if op == 0x4D:  # quotes included
+                    ret.append((scr_idx, scr_path, i, lnos[i], 'str', j, n,
+                                decode(exp[off+1:off+size-1], encoding)))
+                    n += 1
+                off += size
+    return ret
+
+
+def ystb_patch(data: Buf, kcc: KnownCmdCode, key: int, edits: Iterable[TextEdit], *,
+               encoding: str = CP932) -> bytearray:
+    # -> the ybn with new text: WORD text replaced, or the n-th str in an arg; only expr data
+    # moves, every arg off after a change is shifted, cmds (and so labels) stay where they are
+    ver, dcmd, darg, dexp, dlno = ystb_sections(data, key)
+    c = Cols(ver, dcmd, darg, dlno, kcc)
+    codes, first, lens, offs = c.codes, c.first, c.lens, c.offs
+    owner = [i for i in range(len(codes)) for _ in range(first[i+1]-first[i])]  # arg -> cmd
+    exp = bytes(dexp)
+    branch = (kcc.IF, kcc.ELSE, kcc.LOOP)
+    todo: dict[int, dict[int, str]] = {}  # arg -> n -> text
+    for i, j, n, t in edits:
+        assert 0 <= i < len(codes), f'cmd {i}: only {len(codes)} cmds'
+        code = codes[i]
+        assert code != kcc.RETURNCODE and j < first[i+1]-first[i] and not (j and code in branch), \
+            f'cmd {i}: arg {j} has no text'
+        assert code != kcc.WORD or n == 0, f'cmd {i}: WORD has one text, n={n}'
+        todo.setdefault(first[i]+j, {})[n] = t
+    regs: list[tuple[int, int, int, bytes]] = []  # start, end, arg, new bytes
+    for k, texts in todo.items():
+        siz, off = lens[k], offs[k]
+        if codes[owner[k]] == kcc.WORD:
+            new = texts[0].encode(encoding)
+        else:
+            parts: list[bytes] = []
+            p, end, n = off, off+siz, 0
+            while p < end:
+                op, size = SHead.unpack_from(exp, p)
+                if op == 0x4D and n in texts:  # keep the quotes
+                    q, t = exp[p+3:p+4], texts.pop(n).encode(encoding)
+                    assert q not in t, f'arg {k}: str {n} has its quote {q!r}, no escape exists'
+                    s = q+t+q
+                    assert len(s) <= 0xffff, f'arg {k}: str too long'
+                    parts.append(SHead.pack(op, len(s))+s)
+                else:
+                    parts.append(exp[p:p+3+size])
+                n += op == 0x4D
+                p += 3+size
+            assert not texts, f'arg {k}: no str {sorted(texts)}, only {n}'
+            new = b''.join(parts)
+        regs.append((off, off+siz, k, new))
+    regs.sort()
+    starts = sorted(offs[k] for k, i in enumerate(owner)  # of args with expr data
+                    if lens[k] and codes[i] != kcc.RETURNCODE and not (k-first[i] and codes[i] in branch))
+    for (s0, e0, k, _), nxt in zip(regs, regs[1:]+[(len(exp), 0, -1, b'')]):
+        assert e0 <= nxt[0], f'arg {k} and arg {nxt[2]} share expr data'
+        assert e0 == s0 or bisect_left(starts, e0)-bisect_left(starts, s0) == 1, \
+            f'arg {k}: other args point into its expr data'
+    # new expr data, and for every position the shift of the regions before it
+    out: list[bytes] = []
+    ends: list[int] = []
+    shift = [0]
+    p = 0
+    for s0, e0, _, new in regs:
+        out += exp[p:s0], new
+        p = e0
+        ends.append(e0)
+        shift.append(shift[-1]+len(new)-(e0-s0))
+    out.append(exp[p:])
+
+    def remap(x: int):
+        c = bisect_right(ends, x)
+        while c and regs[c-1][0] >= x:  # an empty region at x is after it
+            c -= 1
+        return x+shift[c]
+    sec = darg if ver >= 300 else dcmd
+    news = {k: len(new) for _, _, k, new in regs}
+    for k, (siz, off, o) in enumerate(zip(lens, offs, c.at)):
+        SArgLen.pack_into(sec, o+4, news.get(k, siz), remap(off))
+    dexp = bytearray(b''.join(out))
+    head = list(SYtbHead.unpack_from(data))
+    head[3 if ver < 300 else 5] = len(dexp)
+    ret = bytearray(SYtbHead.pack(*head))
+    for sec in (dcmd, darg, dexp, dlno):
+        ret += xor_trans(sec, key)
+    return ret
+
+
+def game_text(read: Callable[[str], Buf], key: int, *, encoding: str = CP932) -> Iterator[TextRec]:
+    # read: ybn name -> data, as in decompile; records come in script order
+    kcc = YSCM(MRdr(read('ysc.ybn'), enc=encoding)).kcc
+    for scr in YSTL(MRdr(read('yst_list.ybn'), enc=encoding)).scrs:
+        if scr.nvar >= 0:
+            yield from ystb_text(read(f'yst{scr.idx:0>5}.ybn'), kcc, key, scr.idx, scr.path, encoding=encoding)
+
+
+def dir_text(idir: str, key: int, **kwargs: Any):
+    def read(name: str):
+        with open(path.join(idir, name), 'rb') as fp:
+            return fp.read()
+    return game_text(read, key, **kwargs)
+
+
+def mem_text(files: YPF | Mapping[str, Buf], key: int, *, prefix: str = 'ysbin\\', **kwargs: Any):
+    return game_text(lambda name: files[prefix+name], key, **kwargs)
+
+
+def read_edits(f: TextIO) -> Iterator[dict[str, Any]]:
+    # ndjson or csv (by its header) of records as written below; script, cmd, arg, n and
+    # text are used, the rest is ignored
+    head = f.readline()
+    if head.lstrip().startswith('{'):
+        for l in chain((head,), f):
+            _ = l.strip() and (yield json.loads(l))
+        return
+    for r in csv.DictReader(chain((head,), f)):
+        yield {k: v if k in ('path', 'kind', 'text') else int(v) for k, v in r.items()}
+
+
+def game_patch(read: Callable[[str], Buf], write: Callable[[str, bytes | bytearray], Any], key: int,
+               recs: Iterable[dict[str, Any]], *, encoding: str = CP932):
+    # -> names of the patched ybns; each script is read, patched and written once
+    kcc = YSCM(MRdr(read('ysc.ybn'), enc=encoding)).kcc
+    edits: dict[int, list[TextEdit]] = {}
+    for r in recs:
+        edits.setdefault(r['script'], []).append((r['cmd'], r['arg'], r.get('n', 0), r['text']))
+    done: list[str] = []
+    for idx, es in sorted(edits.items()):
+        data = read(name := f'yst{idx:0>5}.ybn')
+        write(name, ystb_patch(data, kcc, key, es, encoding=encoding))
+        done.append(name)
+    return done
+
+
+def dir_patch(idir: str, odir: str, key: int, recs: Iterable[dict[str, Any]], **kwargs: Any):
+    # odir gets the patched ybns only, it may be idir
+    def read(name: str):
+        with open(path.join(idir, name), 'rb') as fp:
+            return fp.read()
+
+    def write(name: str, data: bytes | bytearray):
+        makedirs(odir, exist_ok=True)
+        with open(path.join(odir, name), 'wb') as fp:
+            fp.write(data)
+    return game_patch(read, write, key, recs, **kwargs)
+
+
+def write_ndjson(recs: Iterable[TextRec], f: TextIO):
+    # same lines as json.dumps(dict(zip(TextKeys, r)), ensure_ascii=False), at a fraction of
+    # the cost: only the strs need escaping, and the path once per script
+    n, last, head, buf = 0, None, '', []
+    for n, (s, p, i, l, k, j, m, t) in enumerate(recs, 1):
+        if (s, p) != last:
+            last, head = (s, p), f'{{"script": {s}, "path": {encode_basestring(p)}, "cmd": '
+        buf.append(f'{head}{i}, "line": {l}, "kind": "{k}", "arg": {j}, "n": {m}, "text": {encode_basestring(t)}}}\n')
+        if len(buf) >= 4096:
+            f.write(''.join(buf))
+            buf.clear()
+    f.write(''.join(buf))
+    return n
+
+
+def write_csv(recs: Iterable[TextRec], f: TextIO):  # open f with newline=''
+    w = csv.writer(f)
+    w.writerow(TextKeys)
+    n = 0
+    for n, r in enumerate(recs, 1):
+        w.writerow(r)
+    return n
+
+
+def main(argv: list[str] | None = None):
+    ap = ArgumentParser('yurislib.text')
+    ap.add_argument('ysbin', help='dir, or an archive holding ysbin\\')
+    ap.add_argument('--key', default='KEY_300', help='KEY_200, KEY_300 or a number')
+    ap.add_argument('--encoding', default=CP932)
+    ap.add_argument('--csv', action='store_true', help='csv instead of ndjson')
+    ap.add_argument('--patch', help='ndjson or csv of new text, ysbin must be a dir')
+    ap.add_argument('-o', '--out', help='default: stdout; with --patch, the dir for patched ybns')
+    a = ap.parse_args(argv)
+    key = {'KEY_200': KEY_200, 'KEY_300': KEY_300}.get(a.key) or int(a.key, 0)
+    if a.patch:
+        assert a.out, '--patch needs -o'
+        with open(a.patch, 'r', encoding='utf-8', newline='') as f:
+            done = dir_patch(a.ysbin, a.out, key, read_edits(f), encoding=a.encoding)
+        print(f'{len(done)} scripts patched', file=sys.stderr)
+        return 0
+    out = open(a.out, 'w', encoding='utf-8', newline='') if a.out else stdout
+    try:
+        if path.isdir(a.ysbin):
+            n = (write_csv if a.csv else write_ndjson)(dir_text(a.ysbin, key, encoding=a.encoding), out)
+        else:
+            with open(a.ysbin, 'rb') as fp:
+                recs = mem_text(YPF(fp, lazy=True), key, encoding=a.encoding)
+                n = (write_csv if a.csv else write_ndjson)(recs, out)
+    finally:
+        _ = a.out and out.close()
+    print(f'{n} records', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())